@@ -1,76 +1,110 @@
 import streamlit as st
 import pandas as pd
-import os
 import sys
 import tempfile
+import io
+import os
 import shutil
-import uuid
-from PIL import Image
-from concurrent.futures import ThreadPoolExecutor
+import zipfile
+import numpy as np
+import pyarrow.parquet as pq
 
 # ---- Import your project modules ----
 sys.path.append("C:/Users/pavit/LayoutLM")
-from src.main import process_image
-from src.parsing.pdf2img import pdf_to_images
-from src.labelling.highlight_labels import highlight_labels
+from src.main import process_pdf
+from src.parsing.pdf2img import pdf_page_count
+from src.labelling.highlight_labels import highlight_regions, preview_image, render_highlights
+from src.dataset.parquet_writer import entries_to_table
+from src.instrumentation import StatsSink, add_sink, remove_sink
 
 
 # ---- Streamlit Setup ----
 st.set_page_config(page_title="LayoutLM Dataset Preparation", layout="wide")
 st.title("📘 LayoutLM Dataset Preparation Tool")
-st.caption("Upload PDF → Extract raw LayoutLM chunks → Visualize highlights → Download CSV")
+st.caption("Upload PDF → Extract raw LayoutLM chunks → Visualize highlights → Download Parquet / CSV")
+
+PREVIEW_SIZE = (1200, 1600)  # pages are kept and highlighted at this size for the viewer
+PREVIEW_QUALITY = 85         # previews are held in the session as JPEG bytes, not decoded arrays
 
 # ---- State ----
 if "df" not in st.session_state:
     st.session_state.df = None
-if "highlight_images" not in st.session_state:
-    st.session_state.highlight_images = []
+if "previews" not in st.session_state:
+    st.session_state.previews = {}  # image_path -> preview-size page as JPEG bytes
+if "regions" not in st.session_state:
+    st.session_state.regions = {}   # image_path -> (categories, 0-1000 boxes)
 if "processed" not in st.session_state:
     st.session_state.processed = False
-if "out_dir" not in st.session_state:
-    st.session_state.out_dir = None
-
-
-# ---- Cached helper functions ----
-@st.cache_data(show_spinner=False)
-def cached_pdf_to_images(pdf_path):
-    return pdf_to_images(pdf_path=pdf_path, IMAGES_DIR="Images")
-
-
-@st.cache_data(show_spinner=False)
-def cached_process_image(image_path, page_id):
-    return process_image(image_path=image_path, page_id=page_id, doc_id=0, ocr="doctr")
-
-
-def process_and_highlight(pdf_path: str):
-    """Run OCR + tokenization + highlighting pipeline."""
-    out_dir = os.path.join("highlighted_images_output", f"run_{uuid.uuid4().hex[:8]}")
-    os.makedirs(out_dir, exist_ok=True)
-
-    # Step 1: PDF → images
-    img_paths = cached_pdf_to_images(pdf_path)
-
-    # Step 2: Process pages (multi-threaded)
-    results_all = []
-    with ThreadPoolExecutor(max_workers=4) as executor:
-        futures = [executor.submit(cached_process_image, p, i) for i, p in enumerate(img_paths)]
-        for i, f in enumerate(futures):
-            page_results = f.result()  # list of chunk dicts
-            results_all.extend(page_results)  # flatten directly
-            highlight_labels(page_results, out_dir)
-            st.progress((i + 1) / len(img_paths))
+if "stats" not in st.session_state:
+    st.session_state.stats = None
+if "downloads" not in st.session_state:
+    st.session_state.downloads = {}  # download name -> bytes, built once per processed PDF
+if "images_dir" not in st.session_state:
+    st.session_state.images_dir = None  # where this run's page PNGs were written; removed by the next run
+
+
+def encode_preview(page) -> bytes:
+    """Preview-size JPEG of a page, decoded again only when it is viewed."""
+    buf = io.BytesIO()
+    preview_image(page, PREVIEW_SIZE).save(buf, format="JPEG", quality=PREVIEW_QUALITY)
+    return buf.getvalue()
+
+
+def process_and_highlight(pdf_path: str, images_dir: str, text_layer: bool = False, adaptive: bool = False):
+    """
+    Run OCR + tokenization, saving the page PNGs to `images_dir` (so each
+    chunk's image_path exists) and keeping a preview-size JPEG of each page
+    and its merged header/table regions; pages are only decoded and
+    highlighted when viewed.
+    """
+    # Step 1 + 2: PDF → in-memory pages → batched OCR / tokenization
+    n_pages = pdf_page_count(pdf_path)
+    results_all, previews, regions = [], {}, {}
+    done = 0
+    stats = add_sink(StatsSink())  # per-stage timings and counters of this run
+    try:
+        for batch_results, page_images in process_pdf(pdf_path, doc_id=0, IMAGES_DIR=images_dir, ocr="doctr",
+                                                      text_layer=text_layer,
+                                                      adaptive=adaptive):
+            results_all.extend(batch_results)  # flatten directly
+            regions.update(highlight_regions(batch_results))
+            for image_path, page in page_images.items():
+                previews[image_path] = encode_preview(page)
+            done += len(page_images)
+            st.progress(done / n_pages)
+    finally:
+        remove_sink(stats)
 
     # Step 3: Convert to DataFrame directly
     df = pd.DataFrame(results_all)
-
-    # Step 4: Collect highlighted images
-    highlight_images = [
-        os.path.join(out_dir, f)
-        for f in sorted(os.listdir(out_dir))
-        if f.lower().endswith(".png")
-    ]
-
-    return df, highlight_images, out_dir
+    return df, previews, regions, stats.summary()
+
+
+def dataset_zip(df: pd.DataFrame, images_dir: str) -> bytes:
+    """
+    The dataset as Parquet plus the page PNGs under images/, with image_path
+    rewritten relative to the archive so the download is self-contained.
+    """
+    records = df.assign(image_path=["images/" + os.path.basename(p) for p in df["image_path"]]).to_dict("records")
+    parquet_buf = io.BytesIO()
+    pq.write_table(entries_to_table(records), parquet_buf, compression="zstd")
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        zf.writestr("layoutlm_chunks_raw.parquet", parquet_buf.getvalue())
+        for name in sorted(os.listdir(images_dir)):
+            zf.write(os.path.join(images_dir, name), f"images/{name}")  # PNGs are already compressed
+    return buf.getvalue()
+
+
+def build_downloads(df: pd.DataFrame, images_dir: str) -> dict:
+    """Parquet, CSV and ZIP payloads of one processed PDF, built once rather than on every rerun."""
+    parquet_buf = io.BytesIO()
+    pq.write_table(entries_to_table(df.to_dict("records")), parquet_buf, compression="zstd")
+    return {
+        "parquet": parquet_buf.getvalue(),
+        "csv": df.to_csv(index=False).encode("utf-8"),
+        "zip": dataset_zip(df, images_dir),
+    }
 
 
 # ---- PDF Upload ----
@@ -83,18 +117,26 @@ if uploaded_pdf is not None:
 
     st.success("✅ PDF uploaded successfully!")
 
+    text_layer = st.checkbox("Use the PDF's text layer where available (OCR only scanned pages)", value=False)
+    adaptive = st.checkbox("Adaptive resolution (detect tables on downscaled pages)", value=False)
+
     # ---- Run Processing ----
     if st.button("🚀 Run OCR & Prepare Dataset"):
         with st.spinner("🔄 Processing PDF..."):
             # Clean previous run
-            if st.session_state.out_dir and os.path.exists(st.session_state.out_dir):
-                shutil.rmtree(st.session_state.out_dir, ignore_errors=True)
-
-            df, highlight_images, out_dir = process_and_highlight(pdf_path)
+            if st.session_state.images_dir and os.path.exists(st.session_state.images_dir):
+                shutil.rmtree(st.session_state.images_dir, ignore_errors=True)
+            st.session_state.images_dir = None
+            images_dir = tempfile.mkdtemp(prefix="layoutlm_pages_")
+            df, previews, regions, stats = process_and_highlight(pdf_path, images_dir, text_layer=text_layer,
+                                                                 adaptive=adaptive)
 
             st.session_state.df = df
-            st.session_state.highlight_images = highlight_images
-            st.session_state.out_dir = out_dir
+            st.session_state.previews = previews
+            st.session_state.regions = regions
+            st.session_state.stats = stats
+            st.session_state.images_dir = images_dir
+            st.session_state.downloads = build_downloads(df, images_dir)
             st.session_state.processed = True
 
         st.success("✅ Processing completed successfully!")
@@ -105,28 +147,48 @@ if st.session_state.processed:
     st.subheader("📊 Extracted Raw Chunks Data")
     st.dataframe(st.session_state.df, use_container_width=True, height=400)
 
-    # ---- Download CSV ----
-    csv_data = st.session_state.df.to_csv(index=False).encode("utf-8")
+    if st.session_state.stats:
+        with st.expander("⏱️ Stage timings"):
+            stats = st.session_state.stats
+            st.dataframe(pd.DataFrame(stats["stages"]).T.sort_values("seconds", ascending=False))
+            st.write(stats["counters"])
+
+    # ---- Download Parquet / CSV ----
+    downloads = st.session_state.downloads
+    st.download_button(
+        label="💾 Download Dataset as Parquet",
+        data=downloads["parquet"],
+        file_name="layoutlm_chunks_raw.parquet",
+        mime="application/octet-stream",
+    )
+
     st.download_button(
         label="💾 Download Dataset as CSV",
-        data=csv_data,
+        data=downloads["csv"],
         file_name="layoutlm_chunks_raw.csv",
         mime="text/csv",
     )
 
+    if "zip" in downloads:
+        st.download_button(
+            label="💾 Download Dataset + Page Images (ZIP)",
+            data=downloads["zip"],
+            file_name="layoutlm_dataset.zip",
+            mime="application/zip",
+        )
+
     # ---- Highlight Viewer ----
     st.subheader("🖼️ Highlighted Pages Viewer")
 
-    if st.session_state.highlight_images:
-        options = [f"Page {i+1}" for i in range(len(st.session_state.highlight_images))]
+    if st.session_state.previews:
+        image_paths = sorted(st.session_state.previews)
+        options = [f"Page {i+1}" for i in range(len(image_paths))]
         selected_page = st.selectbox("Select a page to view:", options, index=0)
 
-        page_index = options.index(selected_page)
-        img_path = st.session_state.highlight_images[page_index]
-        img = Image.open(img_path)
-
-        # Resize image for better Streamlit fit
-        img.thumbnail((1200, 1600))
+        # only the page being viewed is highlighted, at preview size
+        image_path = image_paths[options.index(selected_page)]
+        empty = (np.zeros(0, dtype=np.int64), np.zeros((0, 4), dtype=np.int64))
+        img = render_highlights(st.session_state.previews[image_path], *st.session_state.regions.get(image_path, empty))
         st.image(img, caption=selected_page, use_container_width=False)
     else:
         st.warning("⚠️ No highlighted images generated.")
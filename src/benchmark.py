@@ -0,0 +1,338 @@
+"""
+CPU-only benchmark over the sample PDFs in `pdf/`.
+
+Times every pipeline stage separately, reports pages/sec, tokens/sec and peak
+RSS, compares against a stored JSON baseline, and checks that the generated
+chunks still match the reference CSVs in `output/` (labels are compared as
+categories, see `label_categories`).
+
+    python -m src.benchmark                    # run, compare with bench/baseline.json
+    python -m src.benchmark --save-baseline    # run and (re)write the baseline
+
+Exits with status 1 when a stage regressed or the chunks differ from the references.
+"""
+import os
+os.environ.setdefault("CUDA_VISIBLE_DEVICES", "")  # CPU only, before torch is imported
+
+import argparse
+import ast
+import json
+import platform
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+from src.parsing.ocr import (get_model, doctr_page_words, page_from_layout, normalize_page, package_version,
+                             DOCTR_BATCH_SIZE)
+from src.parsing.tables import detect_tables, TABLE_MODES
+from src.parsing.cache import configure_ocr_cache
+from src.parsing.pdf2img import pdf_to_images
+from src.parsing.page_image import load_page_image
+from src.labelling.synthetic_labelling import synthetic_labeling
+from src.labelling.highlight_labels import highlight_labels
+from src.tokenizer.tokenizer import tokenize_and_align_batch, get_processor
+from src.dataset.parquet_writer import ParquetShardWriter
+from src.main import entries_from_tokens, write_document_csv
+
+# in pipeline order; a stage's time is summed over all sample documents
+STAGES = [
+    "pdf_to_images",       # rasterize with poppler + decode to RGB arrays
+    "doctr",               # docTR detection + recognition
+    "img2table",           # table detection over the docTR words
+    "check_headers",       # header / table rules (check_headers, is_bold, assign_tables)
+    "normalize_bboxes",    # pixel -> 0-1000 boxes
+    "synthetic_labeling",
+    "tokenize_and_align",  # batched LayoutLMv3 tokenization + label / box alignment
+    "sliding_window_chunks",
+    "highlight_labels",
+    "write_output",        # per-document CSV + Parquet
+]
+COMPARED_FIELDS = ["id", "page", "words", "input_ids", "attention_mask", "labels", "bboxes"]
+# the reference CSVs predate the table labelling that starts a new B-TABLE at every table,
+# so B-TABLE / I-TABLE are compared as one "table" category; everything else exactly
+LABEL_CATEGORIES = {3: 4}  # B-TABLE -> I-TABLE
+LIST_FIELDS = ["words", "input_ids", "attention_mask", "labels", "bboxes"]
+
+
+class StageTimer:
+    """Accumulates wall-clock seconds per stage."""
+
+    def __init__(self):
+        self.seconds = {name: 0.0 for name in STAGES}
+
+    @contextmanager
+    def __call__(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[stage] += time.perf_counter() - start
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB (None where `resource` is unavailable, e.g. Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024  # bytes on macOS, KB on Linux
+
+
+def run_document(pdf_path: Path, doc_id: int, work_dir: Path, timer: StageTimer, dpi: int, tables: str,
+                 batch_size: int) -> Dict:
+    """Run the pipeline on one PDF stage by stage; returns its entries, page and token counts."""
+    with timer("pdf_to_images"):
+        image_paths = pdf_to_images(str(pdf_path), work_dir / "images", dpi=dpi, overwrite=True)
+        rgb_pages = [load_page_image(p) for p in image_paths]
+
+    pages = []
+    for start in range(0, len(rgb_pages), batch_size):
+        batch = rgb_pages[start:start + batch_size]
+        with timer("doctr"):
+            doc_result = get_model()(batch)
+        for rgb_page, doctr_page in zip(batch, doc_result.pages):
+            with timer("doctr"):
+                layout = doctr_page_words(doctr_page)
+            with timer("img2table"):
+                table_bboxes = detect_tables(rgb_page, doctr_page=doctr_page, mode=tables)
+                layout["table_bboxes"] = np.asarray(table_bboxes, dtype=np.int32).reshape(-1, 4)
+            with timer("check_headers"):
+                pages.append(page_from_layout(layout, rgb_page))
+
+    kept = [i for i, page in enumerate(pages) if len(page)]
+    batch_words, batch_bboxes, batch_labels = [], [], []
+    for i in kept:
+        page = pages[i]
+        with timer("normalize_bboxes"):
+            page.norm_bboxes = None  # page_from_layout already filled them; time the conversion itself
+            normalize_page(page)
+            batch_bboxes.append(page.norm_bboxes.tolist())
+        with timer("synthetic_labeling"):
+            batch_labels.append(synthetic_labeling(page))
+        batch_words.append(page.words)
+
+    with timer("tokenize_and_align"):
+        tokenized = tokenize_and_align_batch(batch_words, batch_bboxes, batch_labels)
+
+    entries = []
+    with timer("sliding_window_chunks"):
+        for i, tok in zip(kept, tokenized):
+            entries.extend(entries_from_tokens(tok, image_paths[i], i, doc_id))
+
+    with timer("highlight_labels"):
+        highlight_labels(entries, work_dir / "highlighted",
+                         images={str(p): rgb for p, rgb in zip(image_paths, rgb_pages)})
+
+    with timer("write_output"):
+        write_document_csv(entries, work_dir / f"{pdf_path.stem}_output.csv")
+        with ParquetShardWriter(work_dir, prefix=pdf_path.stem, overwrite=True) as writer:
+            writer.write(entries)
+
+    return {"entries": entries, "pages": len(pages),
+            "tokens": int(sum(len(tok["input_ids"]) for tok in tokenized))}
+
+
+def load_reference(csv_path: Path) -> List[Dict]:
+    """Read one of the reference CSVs (stringified lists) back into entry dicts."""
+    import pandas as pd
+    df = pd.read_csv(csv_path)
+    for field in LIST_FIELDS:
+        df[field] = df[field].map(ast.literal_eval)
+    return df.to_dict("records")
+
+
+def label_categories(labels: List[int]) -> List[int]:
+    """Labels with B-TABLE and I-TABLE collapsed into one table category."""
+    return [LABEL_CATEGORIES.get(label, label) for label in labels]
+
+
+def compare_entries(entries: List[Dict], reference: List[Dict]) -> List[str]:
+    """
+    Differences between generated and reference chunks in COMPARED_FIELDS
+    (labels as `label_categories`, image_path by file name only).
+    """
+    problems = []
+    if len(entries) != len(reference):
+        problems.append(f"{len(entries)} chunks, reference has {len(reference)}")
+    for got, ref in zip(entries, reference):
+        for field in COMPARED_FIELDS:
+            got_value, ref_value = got[field], ref[field]
+            if field == "labels":
+                got_value, ref_value = label_categories(got_value), label_categories(ref_value)
+            if got_value != ref_value:
+                problems.append(f"{ref['id']}: field '{field}' differs")
+                break
+        else:
+            if Path(str(got["image_path"])).name != Path(str(ref["image_path"]).replace("\\", "/")).name:
+                problems.append(f"{ref['id']}: field 'image_path' differs")
+    return problems
+
+
+def environment() -> Dict:
+    """What the numbers depend on; a baseline from a different environment is only indicative."""
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "packages": {pkg: package_version(pkg) for pkg in ["python-doctr", "torch", "img2table", "transformers",
+                                                     "tokenizers", "numpy", "pdf2image"]},
+    }
+
+
+def run_benchmark(pdf_paths: List[Path], dpi: int = 200, tables: str = "reuse",
+                  batch_size: int = DOCTR_BATCH_SIZE, repeat: int = 1, torch_threads: int = None) -> Dict:
+    """
+    Benchmark the sample PDFs (doc ids follow the sorted file order, as in the
+    reference CSVs). Models are loaded before timing; with `repeat` > 1 the
+    fastest run of each stage is kept. Returns the report dict.
+    """
+    configure_ocr_cache(None)  # measure docTR / img2table, not the cache
+    if torch_threads:
+        import torch
+        torch.set_num_threads(torch_threads)
+
+    load_start = time.perf_counter()
+    get_model()
+    get_processor()
+    if tables != "off":
+        import src.parsing.img2table_adapters  # noqa: F401
+    model_load = time.perf_counter() - load_start
+
+    best, documents = None, {}
+    for _ in range(max(1, repeat)):
+        timer = StageTimer()
+        with tempfile.TemporaryDirectory() as tmp:
+            for doc_id, pdf_path in enumerate(pdf_paths):
+                work_dir = Path(tmp) / pdf_path.stem
+                work_dir.mkdir(parents=True)
+                documents[pdf_path.stem] = run_document(pdf_path, doc_id, work_dir, timer, dpi, tables, batch_size)
+        best = timer.seconds if best is None else {k: min(v, timer.seconds[k]) for k, v in best.items()}
+
+    n_pages = sum(d["pages"] for d in documents.values())
+    n_tokens = sum(d["tokens"] for d in documents.values())
+    total = sum(best.values())
+    return {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "environment": environment(),
+        "settings": {"pdfs": [p.name for p in pdf_paths], "dpi": dpi, "tables": tables,
+                     "batch_size": batch_size, "repeat": repeat, "torch_threads": torch_threads},
+        "pages": n_pages,
+        "tokens": n_tokens,
+        "model_load_seconds": model_load,
+        "total_seconds": total,
+        "pages_per_sec": n_pages / total if total else None,
+        "tokens_per_sec": n_tokens / total if total else None,
+        "peak_rss_mb": peak_rss_mb(),
+        "stages": {
+            name: {"seconds": sec, "pages_per_sec": n_pages / sec if sec else None}
+            for name, sec in best.items()
+        },
+        "documents": documents,
+    }
+
+
+def find_regressions(report: Dict, baseline: Dict, tolerance: float, min_seconds: float) -> List[str]:
+    """
+    Stages (and totals) that got more than `tolerance` slower than the baseline.
+    Differences under `min_seconds` are ignored as timer noise.
+    """
+    regressions = []
+    timings = {name: stage["seconds"] for name, stage in report["stages"].items()}
+    timings["total"] = report["total_seconds"]
+    base_timings = {name: stage["seconds"] for name, stage in baseline.get("stages", {}).items()}
+    base_timings["total"] = baseline.get("total_seconds")
+    for name, sec in timings.items():
+        base = base_timings.get(name)
+        if base is not None and sec > base * (1 + tolerance) and sec - base > min_seconds:
+            regressions.append(f"{name}: {sec:.3f}s vs baseline {base:.3f}s (+{(sec / base - 1) * 100:.0f}%)")
+    rss, base_rss = report.get("peak_rss_mb"), baseline.get("peak_rss_mb")
+    if rss and base_rss and rss > base_rss * (1 + tolerance):
+        regressions.append(f"peak RSS: {rss:.0f} MB vs baseline {base_rss:.0f} MB")
+    return regressions
+
+
+def print_report(report: Dict, baseline: Dict = None) -> None:
+    base_stages = (baseline or {}).get("stages", {})
+    print(f"{report['pages']} pages, {report['tokens']} tokens "
+          f"(model load {report['model_load_seconds']:.1f}s, not included below)")
+    print(f"{'stage':<24}{'seconds':>10}{'pages/s':>10}{'share':>8}{'baseline':>10}")
+    for name, stage in report["stages"].items():
+        share = stage["seconds"] / report["total_seconds"] * 100 if report["total_seconds"] else 0
+        pps = f"{stage['pages_per_sec']:.2f}" if stage["pages_per_sec"] else "-"
+        base = f"{base_stages[name]['seconds']:.3f}" if name in base_stages else "-"
+        print(f"{name:<24}{stage['seconds']:>10.3f}{pps:>10}{share:>7.1f}%{base:>10}")
+    print(f"{'total':<24}{report['total_seconds']:>10.3f}{report['pages_per_sec'] or 0:>10.2f}")
+    print(f"tokens/sec: {report['tokens_per_sec'] or 0:.1f}")
+    if report["peak_rss_mb"] is not None:
+        print(f"peak RSS: {report['peak_rss_mb']:.0f} MB")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Per-stage benchmark over the sample PDFs.")
+    parser.add_argument("--pdf-dir", default="pdf")
+    parser.add_argument("--reference-dir", default="output", help="reference `<stem>_output.csv` files")
+    parser.add_argument("--baseline", default="bench/baseline.json")
+    parser.add_argument("--save-baseline", action="store_true", help="write this run as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.20, help="allowed slowdown per stage (0.2 = 20%%)")
+    parser.add_argument("--min-seconds", type=float, default=0.05, help="ignore smaller absolute slowdowns")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per stage; the fastest is kept")
+    parser.add_argument("--dpi", type=int, default=200)
+    parser.add_argument("--tables", default="reuse", choices=list(TABLE_MODES))
+    parser.add_argument("--batch-size", type=int, default=DOCTR_BATCH_SIZE)
+    parser.add_argument("--torch-threads", type=int, default=None)
+    parser.add_argument("--skip-verify", action="store_true", help="do not compare with the reference CSVs")
+    args = parser.parse_args(argv)
+
+    pdf_paths = sorted(Path(args.pdf_dir).glob("test_pdf*.pdf"))
+    if not pdf_paths:
+        parser.error(f"no test_pdf*.pdf files in {args.pdf_dir}")
+    report = run_benchmark(pdf_paths, dpi=args.dpi, tables=args.tables, batch_size=args.batch_size,
+                           repeat=args.repeat, torch_threads=args.torch_threads)
+    documents = report.pop("documents")
+
+    failed = False
+    baseline_path = Path(args.baseline)
+    baseline = json.loads(baseline_path.read_text()) if baseline_path.exists() else None
+    print_report(report, baseline)
+
+    if not args.skip_verify:
+        for stem, doc in documents.items():
+            reference = Path(args.reference_dir) / f"{stem}_output.csv"
+            if not reference.exists():
+                print(f"no reference for {stem}, not verified")
+                continue
+            problems = compare_entries(doc["entries"], load_reference(reference))
+            if problems:
+                failed = True
+                print(f"MISMATCH {stem}: {len(problems)} problem(s), first: {problems[0]}")
+            else:
+                print(f"OK {stem}: {len(doc['entries'])} chunks match {reference}")
+
+    if baseline is not None and not args.save_baseline:
+        if baseline.get("environment") != report["environment"]:
+            print("note: baseline was recorded in a different environment")
+        regressions = find_regressions(report, baseline, args.tolerance, args.min_seconds)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        failed = failed or bool(regressions)
+    elif baseline is None and not args.save_baseline:
+        print(f"no baseline at {baseline_path}; run with --save-baseline to record one")
+
+    if args.save_baseline:
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        baseline_path.write_text(json.dumps(report, indent=2))
+        print(f"Wrote baseline {baseline_path}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
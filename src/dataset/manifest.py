@@ -0,0 +1,203 @@
+import hashlib
+import io
+import json
+import os
+import shutil
+import sqlite3
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional
+import numpy as np
+from src.parsing.cache import pack_arrays, unpack_arrays
+
+# Per-page stage manifest for resumable, incremental dataset builds.
+# For every document and page it records the input hash, each completed stage
+# (rasterize -> ocr -> label -> chunk) with a fingerprint of the configuration
+# it ran with, and the stage's artifact on disk. A rerun only redoes stages
+# whose input or configuration fingerprint changed.
+
+STAGES = ("rasterize", "ocr", "label", "chunk")
+MANIFEST_NAME = "manifest.sqlite"
+ARTIFACTS_DIR = "stages"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    doc_key    TEXT PRIMARY KEY,
+    doc_id     INTEGER UNIQUE NOT NULL,
+    input_hash TEXT NOT NULL,
+    n_pages    INTEGER NOT NULL,
+    exported   TEXT
+);
+CREATE TABLE IF NOT EXISTS stages (
+    doc_id     INTEGER NOT NULL,
+    page       INTEGER NOT NULL,
+    stage      TEXT NOT NULL,
+    input_hash TEXT NOT NULL,
+    config     TEXT NOT NULL,
+    artifact   TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (doc_id, page, stage)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+def file_digest(path: str, block_size: int = 1 << 20) -> str:
+    """Content hash of an input file (a whole PDF)."""
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def config_digest(*parts) -> str:
+    """Fingerprint of a stage configuration; chain the previous stage's digest in first."""
+    return hashlib.blake2b("|".join(str(p) for p in parts).encode(), digest_size=16).hexdigest()
+
+
+def artifact_path(out_dir: str, doc_id: int, page: int, suffix: str) -> Path:
+    """Where a page's stage artifact lives, e.g. `<out_dir>/stages/00003/page_00012.labels.npz`."""
+    return Path(out_dir) / ARTIFACTS_DIR / f"{doc_id:05d}" / f"page_{page:05d}.{suffix}"
+
+
+def _atomic_write(path: Path, payload: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    tmp.write_bytes(payload)
+    os.replace(tmp, path)
+
+
+def save_labels(path: Path, words: List[str], norm_bboxes, labels, line_ids=None) -> None:
+    """Label-stage artifact: the page's words, 0-1000 boxes, word labels and (optionally) each word's line."""
+    arrays = {
+        "words": list(words),
+        "norm_bboxes": np.asarray(norm_bboxes, dtype=np.int16).reshape(-1, 4),
+        "labels": np.asarray(labels, dtype=np.int64),
+    }
+    if line_ids is not None:
+        arrays["line_ids"] = np.asarray(line_ids, dtype=np.int32)
+    buf = io.BytesIO()
+    np.savez_compressed(buf, **pack_arrays(arrays))
+    _atomic_write(Path(path), buf.getvalue())
+
+
+def load_labels(path: Path) -> Dict:
+    return _load_npz(path)
+
+
+def save_layout(path: Path, layout: Dict) -> None:
+    """OCR-stage artifact: the page's measured layout (see src.parsing.ocr.measure_page)."""
+    buf = io.BytesIO()
+    np.savez_compressed(buf, **pack_arrays(layout))
+    _atomic_write(Path(path), buf.getvalue())
+
+
+def load_layout(path: Path) -> Dict:
+    return _load_npz(path)
+
+
+def _load_npz(path: Path) -> Dict:
+    with np.load(path, allow_pickle=False) as data:
+        return unpack_arrays({name: data[name] for name in data.files})
+
+
+def save_chunks(path: Path, entries: List[Dict]) -> None:
+    """Chunk-stage artifact: the page's final chunk entries."""
+    _atomic_write(Path(path), json.dumps(entries).encode("utf-8"))
+
+
+def load_chunks(path: Path) -> List[Dict]:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+class BuildManifest:
+    """
+    SQLite manifest `<out_dir>/manifest.sqlite` plus stage artifacts under
+    `<out_dir>/stages/<doc_id>/`. Documents keep a stable `doc_id` across runs,
+    so adding PDFs never renumbers the chunk ids of existing ones.
+    Only the parent process writes to it; workers just write artifact files.
+    """
+
+    def __init__(self, out_dir: str):
+        self.out_dir = Path(out_dir)
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        self.artifact_dir = self.out_dir / ARTIFACTS_DIR
+        self.db = sqlite3.connect(self.out_dir / MANIFEST_NAME)
+        self.db.executescript(_SCHEMA)
+
+    def artifact_path(self, doc_id: int, page: int, suffix: str) -> Path:
+        return artifact_path(self.out_dir, doc_id, page, suffix)
+
+    def document(self, doc_key: str, input_hash: str, n_pages: int) -> int:
+        """
+        Register a document and return its doc_id. If its content changed since
+        the last run, all of its page stages are forgotten.
+        """
+        row = self.db.execute("SELECT doc_id, input_hash FROM documents WHERE doc_key = ?",
+                              (doc_key,)).fetchone()
+        if row is None:
+            doc_id = self.db.execute("SELECT COALESCE(MAX(doc_id) + 1, 0) FROM documents").fetchone()[0]
+            self.db.execute("INSERT INTO documents (doc_key, doc_id, input_hash, n_pages) VALUES (?, ?, ?, ?)",
+                            (doc_key, doc_id, input_hash, n_pages))
+        else:
+            doc_id, old_hash = row
+            if old_hash != input_hash:
+                self.db.execute("DELETE FROM stages WHERE doc_id = ?", (doc_id,))
+                self.db.execute("UPDATE documents SET input_hash = ?, n_pages = ? WHERE doc_id = ?",
+                                (input_hash, n_pages, doc_id))
+        self.db.commit()
+        return doc_id
+
+    def is_done(self, doc_id: int, page: int, stage: str, input_hash: str, config: str) -> bool:
+        """True if `stage` completed for this page with the same input and config, and its artifact still exists."""
+        row = self.db.execute(
+            "SELECT artifact FROM stages WHERE doc_id = ? AND page = ? AND stage = ? AND input_hash = ? AND config = ?",
+            (doc_id, page, stage, input_hash, config)).fetchone()
+        return row is not None and (not row[0] or Path(row[0]).exists())
+
+    def mark(self, doc_id: int, page: int, stage: str, input_hash: str, config: str, artifact: str = "") -> None:
+        self.db.execute("INSERT OR REPLACE INTO stages VALUES (?, ?, ?, ?, ?, ?)",
+                        (doc_id, page, stage, input_hash, config, str(artifact or "")))
+
+    def exported(self, doc_id: int) -> Optional[str]:
+        """Export signature the document was last written to the dataset with (None: not in it)."""
+        row = self.db.execute("SELECT exported FROM documents WHERE doc_id = ?", (doc_id,)).fetchone()
+        return row[0] if row else None
+
+    def set_exported(self, doc_id: int, signature: Optional[str]) -> None:
+        self.db.execute("UPDATE documents SET exported = ? WHERE doc_id = ?", (signature, doc_id))
+
+    def clear_exported(self) -> None:
+        self.db.execute("UPDATE documents SET exported = NULL")
+
+    def get_meta(self, key: str, default=None):
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set_meta(self, key: str, value) -> None:
+        self.db.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, json.dumps(value)))
+
+    def reset(self) -> None:
+        """Forget all stages, artifacts and exports (documents keep their doc_id)."""
+        self.db.execute("DELETE FROM stages")
+        self.db.execute("DELETE FROM meta")
+        self.clear_exported()
+        self.db.commit()
+        shutil.rmtree(self.artifact_dir, ignore_errors=True)
+
+    def commit(self) -> None:
+        self.db.commit()
+
+    def close(self) -> None:
+        self.db.commit()
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,130 @@
+import json
+from pathlib import Path
+from typing import Dict, List
+import numpy as np
+
+# Fixed-width token store for training: every chunk is padded to max_len and
+# appended to one flat binary file per field, so chunk i is just a slice of a
+# np.memmap. A small index.json maps chunk rows to id / document / page / image
+# (and, for packed sequences, to the pages and token ranges of their segments).
+FIELDS = {
+    "input_ids": (np.int32, ()),
+    "attention_mask": (np.int32, ()),
+    "labels": (np.int32, ()),
+    "bboxes": (np.int16, (4,)),
+}
+PAD_VALUES = {"attention_mask": 0, "labels": -100, "bboxes": 0}
+
+
+class MemmapStoreWriter:
+    """
+    Appends chunk entries to `<out_dir>/<field>.bin` files (int32 ids / mask /
+    labels, int16 (max_len, 4) bboxes) and writes `index.json` on close.
+    Appending to an existing store adds rows after the ones already there;
+    rows left behind by a run that died before writing its index are dropped.
+    `overwrite=True` starts a new, empty store instead.
+    """
+
+    def __init__(self, out_dir: str, max_len: int = 512, pad_id: int = 1, overwrite: bool = False):
+        self.out_dir = Path(out_dir)
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        self.max_len = max_len
+        self.pad_values = dict(PAD_VALUES, input_ids=pad_id)
+        if overwrite:
+            (self.out_dir / "index.json").unlink(missing_ok=True)
+        self.index = _load_index(self.out_dir)
+        self.index = self.index or {"max_len": max_len, "ids": [], "docs": [], "pages": [], "image_paths": [],
+                                    "segments": []}
+        if self.index["max_len"] != max_len:
+            raise ValueError(f"store in {out_dir} has max_len={self.index['max_len']}, not {max_len}")
+        n_rows = len(self.index["ids"])
+        self._files = {}
+        for name, (dtype, inner) in FIELDS.items():
+            f = open(self.out_dir / f"{name}.bin", "ab")
+            f.truncate(n_rows * max_len * int(np.prod(inner, dtype=np.int64)) * np.dtype(dtype).itemsize)
+            self._files[name] = f
+
+    def add_entries(self, entries: List[Dict]) -> None:
+        """Append chunk entries (dicts as built by src.main.build_entries_batch)."""
+        if not entries:
+            return
+        for name, (dtype, inner) in FIELDS.items():
+            block = np.full((len(entries), self.max_len) + inner, self.pad_values[name], dtype=dtype)
+            for row, entry in enumerate(entries):
+                values = entry[name]
+                if len(values) > self.max_len:
+                    raise ValueError(f"chunk {entry['id']} has {len(values)} tokens > max_len={self.max_len}")
+                block[row, :len(values)] = values
+            self._files[name].write(block.tobytes())
+
+        for entry in entries:
+            self.index["ids"].append(entry["id"])
+            self.index["docs"].append(str(entry["id"]).rsplit("_page", 1)[0])
+            self.index["pages"].append(int(entry["page"]))
+            self.index["image_paths"].append(str(entry["image_path"]))
+            self.index.setdefault("segments", [None] * (len(self.index["ids"]) - 1)).append(entry.get("segments"))
+
+    def close(self) -> Path:
+        for f in self._files.values():
+            f.close()
+        with open(self.out_dir / "index.json", "w", encoding="utf-8") as f:
+            json.dump(self.index, f)
+        return self.out_dir
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _load_index(store_dir: Path):
+    path = Path(store_dir) / "index.json"
+    if not path.exists():
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+class MemmapChunkDataset:
+    """
+    Random access to a store written by MemmapStoreWriter. `dataset[i]` returns
+    read-only memmap views (no parsing, no copies) plus the chunk's metadata;
+    usable directly as a torch `Dataset` by DataLoader workers. The memmaps are
+    opened lazily in each process and are never pickled.
+    """
+
+    def __init__(self, store_dir: str):
+        self.store_dir = Path(store_dir)
+        self.index = _load_index(self.store_dir)
+        if self.index is None:
+            raise FileNotFoundError(f"no index.json in {store_dir}")
+        self.max_len = self.index["max_len"]
+        self._arrays = None
+
+    def _open(self) -> Dict[str, np.memmap]:
+        if self._arrays is None:
+            n = len(self)
+            self._arrays = {
+                name: np.memmap(self.store_dir / f"{name}.bin", dtype=dtype, mode="r",
+                                shape=(n, self.max_len) + inner)
+                for name, (dtype, inner) in FIELDS.items()
+            }
+        return self._arrays
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_arrays"] = None
+        return state
+
+    def __len__(self) -> int:
+        return len(self.index["ids"])
+
+    def __getitem__(self, i: int) -> Dict:
+        arrays = self._open()
+        item = {name: arr[i] for name, arr in arrays.items()}
+        segments = self.index.get("segments")  # missing in stores written before packing
+        item.update(id=self.index["ids"][i], doc=self.index["docs"][i],
+                    page=self.index["pages"][i], image_path=self.index["image_paths"][i],
+                    segments=segments[i] if segments else None)
+        return item
@@ -0,0 +1,98 @@
+from pathlib import Path
+from typing import Dict, Iterable, List
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Typed schema for chunk entries (see src.main.build_entries_batch).
+# Loadable directly with `datasets.load_dataset("parquet", data_files="<dir>/*.parquet")`.
+CHUNK_SCHEMA = pa.schema([
+    ("id", pa.string()),
+    ("image_path", pa.string()),
+    ("page", pa.int32()),
+    ("words", pa.list_(pa.string())),
+    ("input_ids", pa.list_(pa.int32())),
+    ("attention_mask", pa.list_(pa.int8())),
+    ("labels", pa.list_(pa.int32())),
+    ("bboxes", pa.list_(pa.list_(pa.int16(), 4))),
+    # packed sequences only (see src.tokenizer.tokenizer.pack_entries), null otherwise
+    ("segments", pa.list_(pa.struct([("id", pa.string()), ("image_path", pa.string()), ("page", pa.int32()),
+                                     ("start", pa.int32()), ("end", pa.int32())]))),
+])
+OPTIONAL_COLUMNS = {"segments"}
+
+
+def entries_to_table(entries: List[Dict]) -> pa.Table:
+    """Chunk entries -> Arrow table with the typed CHUNK_SCHEMA columns."""
+    columns = {
+        field.name: pa.array([e.get(field.name) if field.name in OPTIONAL_COLUMNS else e[field.name]
+                              for e in entries], type=field.type)
+        for field in CHUNK_SCHEMA
+    }
+    return pa.Table.from_pydict(columns, schema=CHUNK_SCHEMA)
+
+
+class ParquetShardWriter:
+    """
+    Appends chunk entries to Parquet shards `<prefix>-00000.parquet`, ... in
+    `out_dir`, starting a new shard every `rows_per_shard` rows. Entries are
+    buffered and written as row groups, so memory stays bounded however many
+    documents are streamed through. Shards already in `out_dir` are kept and
+    new ones are numbered after them, unless `overwrite=True` removes them.
+    """
+
+    def __init__(self, out_dir: str, prefix: str = "chunks", rows_per_shard: int = 50_000,
+                 row_group_size: int = 1024, compression: str = "zstd", overwrite: bool = False):
+        self.out_dir = Path(out_dir)
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        self.prefix = prefix
+        self.rows_per_shard = rows_per_shard
+        self.row_group_size = row_group_size
+        self.compression = compression
+        self.shard_paths: List[Path] = []
+        existing = sorted(self.out_dir.glob(f"{prefix}-*.parquet"))
+        if overwrite:
+            for path in existing:
+                path.unlink()
+            existing = []
+        self._first_index = len(existing)
+        self._writer = None
+        self._shard_rows = 0
+        self._buffer: List[Dict] = []
+
+    def write(self, entries: Iterable[Dict]) -> None:
+        self._buffer.extend(entries)
+        while len(self._buffer) >= self.row_group_size:
+            self._flush(self.row_group_size)
+
+    def _flush(self, n: int) -> None:
+        while n > 0:
+            if self._writer is None or self._shard_rows >= self.rows_per_shard:
+                self._roll()
+            take = min(n, self.rows_per_shard - self._shard_rows)
+            batch, self._buffer = self._buffer[:take], self._buffer[take:]
+            self._writer.write_table(entries_to_table(batch))
+            self._shard_rows += take
+            n -= take
+
+    def _roll(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+        path = self.out_dir / f"{self.prefix}-{self._first_index + len(self.shard_paths):05d}.parquet"
+        self._writer = pq.ParquetWriter(path, CHUNK_SCHEMA, compression=self.compression)
+        self.shard_paths.append(path)
+        self._shard_rows = 0
+
+    def close(self) -> List[Path]:
+        """Flush remaining entries and close the current shard; returns all shard paths."""
+        if self._buffer:
+            self._flush(len(self._buffer))
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        return self.shard_paths
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,234 @@
+"""
+Structured instrumentation for the pipeline stages.
+
+Stages report events to pluggable sinks (any callable taking an event dict):
+    stage  - one timed run of a stage: {"event": "stage", "stage": "ocr_doctr", "seconds": 1.7, ...}
+    count  - pages, words, tokens, chunks, tables, header lines, cache hits, ...
+    gauge  - instantaneous values such as queue depths of the parallel paths
+Every event also carries "ts", "pid" and the fields of the enclosing
+`context(...)` blocks (document, page, ...). With no sink installed nothing is
+recorded and the overhead is one perf_counter call per stage.
+
+In any process (including spawned workers), events go to a JSON-lines file when
+LAYOUTLM_EVENTS=<path> is set, and LAYOUTLM_PROFILE=<stage,...|all> writes a
+cProfile dump per run of those stages to LAYOUTLM_PROFILE_DIR (default: profiles/).
+Summarize a JSON-lines file with
+
+    python -m src.instrumentation events.jsonl --by pdf
+"""
+import argparse
+import contextvars
+import cProfile
+import itertools
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional
+
+EVENTS_ENV = "LAYOUTLM_EVENTS"
+PROFILE_ENV = "LAYOUTLM_PROFILE"
+PROFILE_DIR_ENV = "LAYOUTLM_PROFILE_DIR"
+DEFAULT_PROFILE_DIR = "profiles"
+
+Sink = Callable[[Dict], None]
+
+_sinks: List[Sink] = []
+_profile_stages = frozenset()
+_profile_dir = Path(DEFAULT_PROFILE_DIR)
+_configured = False
+_context = contextvars.ContextVar("instrumentation_context", default={})
+_profiling = threading.local()
+_profile_ids = itertools.count()
+
+
+class JsonLinesSink:
+    """
+    Appends one JSON object per event to `path`. Each event is a single
+    O_APPEND write, so several worker processes can share one file.
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def __call__(self, event: Dict) -> None:
+        os.write(self._fd, (json.dumps(event, default=str) + "\n").encode("utf-8"))
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+
+class StatsSink:
+    """In-memory totals: calls and seconds per stage, sums per counter, last value per gauge."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages = defaultdict(lambda: {"calls": 0, "seconds": 0.0})
+        self.counters = defaultdict(int)
+        self.gauges = {}
+
+    def __call__(self, event: Dict) -> None:
+        with self._lock:
+            _accumulate(event, self.stages, self.counters, self.gauges)
+
+    def summary(self) -> Dict:
+        with self._lock:
+            return {"stages": {k: dict(v) for k, v in self.stages.items()},
+                    "counters": dict(self.counters), "gauges": dict(self.gauges)}
+
+
+def _accumulate(event: Dict, stages, counters, gauges) -> None:
+    kind = event.get("event")
+    if kind == "stage":
+        totals = stages[event["stage"]]
+        totals["calls"] += 1
+        totals["seconds"] += event["seconds"]
+    elif kind == "count":
+        counters[event["counter"]] += event["value"]
+    elif kind == "gauge":
+        gauges[event["gauge"]] = event["value"]
+
+
+def configure_instrumentation(events_path: Optional[str] = None, profile: Optional[str] = None,
+                              profile_dir: Optional[str] = None, sinks: Iterable[Sink] = ()) -> None:
+    """
+    Set up this process, replacing any earlier configuration: a JSON-lines
+    file (`events_path`), the stages to cProfile (`profile`: comma separated
+    names or "all") and extra sinks.
+    """
+    global _sinks, _profile_stages, _profile_dir, _configured
+    for sink in _sinks:
+        if isinstance(sink, JsonLinesSink):
+            sink.close()
+    _sinks = list(sinks)
+    if events_path:
+        _sinks.append(JsonLinesSink(events_path))
+    _profile_stages = frozenset(s.strip() for s in (profile or "").split(",") if s.strip())
+    _profile_dir = Path(profile_dir or DEFAULT_PROFILE_DIR)
+    _configured = True
+
+
+def _ensure_configured() -> None:
+    if not _configured:
+        configure_instrumentation(os.environ.get(EVENTS_ENV), os.environ.get(PROFILE_ENV),
+                                  os.environ.get(PROFILE_DIR_ENV))
+
+
+def add_sink(sink: Sink) -> Sink:
+    """Register a callback that receives every event of this process; returns it for `remove_sink`."""
+    _ensure_configured()
+    _sinks.append(sink)
+    return sink
+
+
+def remove_sink(sink: Sink) -> None:
+    if sink in _sinks:
+        _sinks.remove(sink)
+
+
+def emit(event: str, **fields) -> None:
+    """Send an event to all sinks (no-op when there are none)."""
+    _ensure_configured()
+    if not _sinks:
+        return
+    record = {"event": event, "ts": time.time(), "pid": os.getpid(), **_context.get(), **fields}
+    for sink in list(_sinks):
+        sink(record)
+
+
+@contextmanager
+def context(**fields):
+    """Attach `fields` (e.g. doc_id, pdf, page) to every event emitted inside the block."""
+    token = _context.set({**_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+def _start_profile(name: str):
+    """cProfile the stage if it was selected and no profiler already runs in this thread."""
+    if not (name in _profile_stages or "all" in _profile_stages) or getattr(_profiling, "active", False):
+        return None
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:  # another profiler (e.g. in another thread on 3.12+) is active
+        return None
+    _profiling.active = True
+    return profiler
+
+
+def _stop_profile(profiler, name: str) -> None:
+    profiler.disable()
+    _profiling.active = False
+    _profile_dir.mkdir(parents=True, exist_ok=True)
+    profiler.dump_stats(_profile_dir / f"{name}-{os.getpid()}-{next(_profile_ids):05d}.prof")
+
+
+@contextmanager
+def stage(name: str, **fields):
+    """Time the block as one run of stage `name` (and cProfile it if selected)."""
+    _ensure_configured()
+    profiler = _start_profile(name) if _profile_stages else None
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        if profiler is not None:
+            _stop_profile(profiler, name)
+        emit("stage", stage=name, seconds=seconds, **fields)
+
+
+def count(name: str, value: int = 1, **fields) -> None:
+    emit("count", counter=name, value=int(value), **fields)
+
+
+def gauge(name: str, value, **fields) -> None:
+    emit("gauge", gauge=name, value=value, **fields)
+
+
+def summarize_events(path: str, by: Optional[str] = None) -> Dict[str, Dict]:
+    """
+    Totals per stage and counter from a JSON-lines event file, grouped by the
+    context field `by` (e.g. "pdf") or over everything.
+    """
+    groups = defaultdict(lambda: (defaultdict(lambda: {"calls": 0, "seconds": 0.0}), defaultdict(int), {}))
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            event = json.loads(line)
+            _accumulate(event, *groups[str(event.get(by, "-")) if by else "all"])
+    return {key: {"stages": {k: dict(v) for k, v in stages.items()}, "counters": dict(counters),
+                  "gauges": dict(gauges)}
+            for key, (stages, counters, gauges) in groups.items()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarize a JSON-lines event file per stage.")
+    parser.add_argument("events", help="file written with --events / LAYOUTLM_EVENTS")
+    parser.add_argument("--by", default=None, help="group by this event field, e.g. pdf or doc_id")
+    args = parser.parse_args(argv)
+
+    for key, summary in summarize_events(args.events, by=args.by).items():
+        stages = summary["stages"]
+        total = sum(s["seconds"] for s in stages.values())
+        print(f"== {args.by or 'all'}: {key}")
+        for name, s in sorted(stages.items(), key=lambda kv: -kv[1]["seconds"]):
+            print(f"  {name:<20}{s['seconds']:>10.3f}s{s['calls']:>8} calls")
+        print(f"  (stage seconds overlap where stages nest; sum {total:.3f}s)")
+        for name, value in sorted(summary["counters"].items()):
+            print(f"  {name:<20}{value:>10}")
+        for name, value in sorted(summary["gauges"].items()):
+            print(f"  {name:<20}{value:>10}  (last value)")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,10 +6,14 @@ Extended version:
     - Tables (B/I-TABLE): Green
 """
 
+import io
 import os
 import json
-from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+import numpy as np
 from PIL import Image, ImageDraw
+from src.parsing.geometry import layoutlm_to_pixels
+from src.instrumentation import stage, emit
 
 # Extended label mapping (inverse of synthetic_labeling)
 LABEL_MAP_INV = {
@@ -25,50 +29,126 @@ COLOR_MAP = {
     "HEADER": {"outline": (0, 0, 255, 200), "fill": (0, 0, 255, 60)},   # Blue
     "TABLE": {"outline": (0, 180, 0, 200), "fill": (0, 255, 0, 60)},    # Green
 }
+CATEGORIES = ("HEADER", "TABLE")  # index = category id used below
+
+# how boxes are grouped before drawing:
+#   words   - one box per labelled word
+#   lines   - one box per run of same-label words on one line
+#   regions - header lines and one box per table
+REGION_MODES = ("words", "lines", "regions")
 
 def denormalize_bbox(norm_bbox, image_size):
     """Convert 0-1000 bbox to pixel coordinates."""
-    w, h = image_size
-    x0 = int((norm_bbox[0] / 1000) * w)
-    y0 = int((norm_bbox[1] / 1000) * h)
-    x1 = int((norm_bbox[2] / 1000) * w)
-    y1 = int((norm_bbox[3] / 1000) * h)
-    return (x0, y0, x1, y1)
-
-def highlight_labels(chunks, outdir):
-    os.makedirs(outdir, exist_ok=True)
-    by_image = defaultdict(list)
+    return tuple(layoutlm_to_pixels([norm_bbox], image_size)[0].tolist())
+
+
+def _page_spans(chunks):
+    """(image_path, chunk, start, end) token ranges per page; packed chunks are split into their segments."""
     for c in chunks:
-        by_image[c["image_path"]].append(c)
-
-    for image_path, chunk_list in by_image.items():
-        pil = Image.open(image_path).convert("RGBA")
-        overlay = Image.new("RGBA", pil.size, (255, 255, 255, 0))
-        draw = ImageDraw.Draw(overlay)
-
-        for c in chunk_list:
-            labels = c["labels"]
-            bboxes = c["bboxes"]
-
-            for lab, bbox in zip(labels, bboxes):
-                if lab is None or lab == -100 or lab == 0:
-                    continue
-
-                label_name = LABEL_MAP_INV.get(lab, "O")
-
-                # Determine category (HEADER / TABLE)
-                if "HEADER" in label_name:
-                    color = COLOR_MAP["HEADER"]
-                elif "TABLE" in label_name:
-                    color = COLOR_MAP["TABLE"]
-                else:
-                    continue
-
-                rect = denormalize_bbox(bbox, pil.size)
-                draw.rectangle(rect, outline=color["outline"], width=2)
-                draw.rectangle(rect, fill=color["fill"])
-
-        combined = Image.alpha_composite(pil, overlay)
-        out_path = os.path.join(outdir, os.path.basename(image_path))
-        combined.convert("RGB").save(out_path, "PNG")
-        print(f"✅ Saved highlighted image: {out_path}")
+        segments = c.get("segments") or [{"image_path": c["image_path"], "start": 0, "end": len(c["labels"])}]
+        for seg in segments:
+            yield seg["image_path"], c, seg["start"], seg["end"]
+
+
+def highlight_regions(chunks, regions: str = "regions") -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+    """
+    Header/table boxes of every page referenced by `chunks`, as
+    {image_path: (category ids (R,), 0-1000 boxes (R, 4))}.
+    Words are deduplicated first (subword tokens and chunk overlaps repeat
+    them), then merged according to `regions` (see REGION_MODES).
+    """
+    per_page = {}
+    for image_path, c, start, end in _page_spans(chunks):
+        per_page.setdefault(image_path, []).append((np.asarray(c["labels"][start:end], dtype=np.int64),
+                                                    np.asarray(c["bboxes"][start:end], dtype=np.int64).reshape(-1, 4)))
+    return {image_path: _merge_words(*_unique_words(spans), regions=regions)
+            for image_path, spans in per_page.items()}
+
+
+def _unique_words(spans):
+    """Labelled words of one page in reading order, once each: (labels (N,), boxes (N, 4))."""
+    labels = np.concatenate([lab for lab, _ in spans])
+    boxes = np.concatenate([box for _, box in spans])
+    keep = (labels >= 1) & (labels <= 4)
+    labels, boxes = labels[keep], boxes[keep]
+    # a word is its box + category; first occurrence keeps the reading order
+    category = (labels >= 3).astype(np.int64)
+    _, first = np.unique(np.column_stack([category, boxes]), axis=0, return_index=True)
+    first.sort()
+    return labels[first], boxes[first]
+
+
+def _merge_words(labels: np.ndarray, boxes: np.ndarray, regions: str = "regions"):
+    category = (labels >= 3).astype(np.int64)
+    if regions == "words" or not len(labels):
+        return category, boxes
+    # a label run starts at B-* or when the category changes; a line also ends when
+    # the next word starts below the previous one or further left
+    new_run = np.ones(len(labels), dtype=bool)
+    new_run[1:] = ((labels[1:] == 1) | (labels[1:] == 3)) | (category[1:] != category[:-1])
+    new_line = new_run.copy()
+    new_line[1:] |= (boxes[1:, 1] >= boxes[:-1, 3]) | (boxes[1:, 0] < boxes[:-1, 0])
+    starts = new_line if regions == "lines" else np.where(category == 1, new_run, new_line)
+
+    idx = np.flatnonzero(starts)
+    merged = np.column_stack([np.minimum.reduceat(boxes[:, 0], idx), np.minimum.reduceat(boxes[:, 1], idx),
+                              np.maximum.reduceat(boxes[:, 2], idx), np.maximum.reduceat(boxes[:, 3], idx)])
+    return category[idx], merged
+
+
+def preview_image(page, max_size: Optional[Tuple[int, int]] = None) -> Image.Image:
+    """
+    RGB PIL copy of a page (path, encoded image bytes, PIL image or RGB
+    array), shrunk to fit `max_size` (w, h) if given; JPEG sources are
+    decoded at reduced size.
+    """
+    if isinstance(page, Image.Image):
+        pil = page.copy()
+    elif isinstance(page, (str, os.PathLike, bytes)):
+        pil = Image.open(io.BytesIO(page) if isinstance(page, bytes) else page)
+        if max_size:
+            pil.draft("RGB", max_size)
+    else:
+        pil = Image.fromarray(page)
+    if max_size:
+        pil.thumbnail(max_size, Image.Resampling.BILINEAR)
+    return pil.convert("RGB")
+
+
+def render_highlights(page, categories, norm_boxes, max_size: Optional[Tuple[int, int]] = None) -> Image.Image:
+    """
+    Draw one page's header/table regions (from `highlight_regions`) on it, at
+    the page's resolution or shrunk to `max_size` first. Boxes are 0-1000,
+    so they are scaled straight to the rendered size; everything is drawn on
+    one overlay with one call per region. Returns an RGB image.
+    """
+    pil = preview_image(page, max_size)
+    overlay = Image.new("RGBA", pil.size, (255, 255, 255, 0))
+    draw = ImageDraw.Draw(overlay)
+    for cat, rect in zip(np.asarray(categories).tolist(), layoutlm_to_pixels(norm_boxes, pil.size).tolist()):
+        color = COLOR_MAP[CATEGORIES[cat]]
+        draw.rectangle(rect, fill=color["fill"], outline=color["outline"], width=2)
+    return Image.alpha_composite(pil.convert("RGBA"), overlay).convert("RGB")
+
+
+def highlight_labels(chunks, outdir, images=None, max_size: Optional[Tuple[int, int]] = None,
+                     regions: str = "regions") -> List[str]:
+    """
+    Draw header/table boxes for every page referenced by `chunks` and save
+    them to `outdir` (shrunk to `max_size` (w, h) if given).
+    `images` optionally maps image_path -> in-memory page (PIL image or RGB
+    array) so pages already decoded by the pipeline are not read from disk again.
+    Returns the saved paths.
+    """
+    images = images or {}
+    os.makedirs(outdir, exist_ok=True)
+    saved = []
+    for image_path, (categories, norm_boxes) in highlight_regions(chunks, regions=regions).items():
+        with stage("highlight", image_path=image_path):
+            page = images.get(image_path)
+            combined = render_highlights(image_path if page is None else page, categories, norm_boxes, max_size)
+            out_path = os.path.join(outdir, os.path.basename(image_path))
+            combined.save(out_path, "PNG")
+        emit("highlight_saved", path=out_path)
+        saved.append(out_path)
+    return saved
@@ -1,5 +1,7 @@
-from typing import List, Dict
+from typing import List, Dict, Union
 import re
+import numpy as np
+from src.parsing.page_tokens import PageTokens
 
 # --- Extended label map ---
 LABEL_MAP = {
@@ -13,19 +15,41 @@ LABEL_MAP = {
 import re
 
 
-def synthetic_labeling(tokens: List[Dict]) -> List[int]:
+def _page_labels(page: PageTokens) -> np.ndarray:
+    """Array version of `synthetic_labeling` over a PageTokens."""
+    is_table = page.inside_table
+    is_header = page.header & ~is_table
+    # run key: 0 = O, 1 = header, k + 2 = table k; a label run starts where the key changes
+    key = np.where(is_table, page.table_ids.astype(np.int64) + 2, is_header.astype(np.int64))
+    starts = np.ones(len(key), dtype=bool)
+    starts[1:] = key[1:] != key[:-1]
+
+    labels = np.full(len(key), LABEL_MAP["O"], dtype=np.int64)
+    labels[is_header] = np.where(starts[is_header], LABEL_MAP["B-HEADER"], LABEL_MAP["I-HEADER"])
+    labels[is_table] = np.where(starts[is_table], LABEL_MAP["B-TABLE"], LABEL_MAP["I-TABLE"])
+    return labels
+
+
+def synthetic_labeling(tokens: Union[List[Dict], PageTokens]) -> List[int]:
     """
     Rule-based synthetic labeling:
     - Header tokens -> B-HEADER / I-HEADER
-    - Table tokens -> B-TABLE / I-TABLE
+    - Table tokens -> B-TABLE / I-TABLE (a new B-TABLE whenever `table_id` changes)
     - All others -> O
+    A PageTokens is labelled with array ops; its labels are also stored on `page.labels`.
     """
+    if isinstance(tokens, PageTokens):
+        tokens.labels = _page_labels(tokens)
+        return tokens.labels.tolist()
+
     labels = []
     prev_type = None  # track if previous token was header/table
+    prev_table_id = None
 
     for t in tokens:
         is_header = bool(t.get("header", False))
         is_table = bool(t.get("inside_table", False))
+        table_id = t.get("table_id")
         line_text = t.get("line_text")
 
         if is_table:
@@ -38,11 +62,12 @@ def synthetic_labeling(tokens: List[Dict]) -> List[int]:
         if curr_type is None:
             labels.append(LABEL_MAP["O"])
         else:
-            if curr_type != prev_type:
+            if curr_type != prev_type or (curr_type == "TABLE" and table_id != prev_table_id):
                 labels.append(LABEL_MAP[f"B-{curr_type}"])
             else:
                 labels.append(LABEL_MAP[f"I-{curr_type}"])
 
         prev_type = curr_type
+        prev_table_id = table_id
 
     return labels
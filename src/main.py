@@ -1,67 +1,740 @@
-from src.parsing.ocr import ocr_pytesseract, normalize_bboxes, ocr_doctr
+import argparse
+import contextvars
+import multiprocessing as mp
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from src.parsing.ocr import (ocr_tesseract_pages, normalize_page, ocr_doctr_pages, doctr_page_layouts,
+                             tesseract_page_layouts, word_layer_layout, page_from_layout, get_model, choose_ocr_backend, doctr_fingerprint, tesseract_fingerprint, AUTO_SAMPLE_PAGES,
+                             AUTO_MIN_WORDS, AUTO_MIN_CONFIDENCE, DOCTR_BATCH_SIZE)
+from src.parsing.tables import TABLE_MODES
+from src.parsing.text_layer import read_text_layer, has_text_layer, text_layer_fingerprint
+from src.parsing.page_tokens import PageTokens
+from src.parsing.cache import configure_ocr_cache, CACHE_DIR_ENV
 from src.labelling.synthetic_labelling import synthetic_labeling
-from src.tokenizer.tokenizer import tokenize_and_align_labels, sliding_window_chunks
-from PIL import Image
+from src.tokenizer.tokenizer import (tokenize_and_align_batch, sliding_window_chunks, line_window_chunks, pack_entries,
+                                     sequence_stats, get_processor, MODEL_NAME, CHUNKING)
+from src.dataset.manifest import (BuildManifest, STAGES, artifact_path, config_digest, file_digest,
+                                  save_layout, load_layout, save_labels, load_labels, save_chunks, load_chunks)
+from src.parsing.pdf2img import iter_pdf_images, pdf_page_count, pdf_page_range, prefetch
+from src.parsing.page_image import PageImage, load_page_image
+from src.instrumentation import configure_instrumentation, context, stage, count, gauge, EVENTS_ENV, PROFILE_ENV
+from pathlib import Path
+from typing import Dict, List
+import numpy as np
 
 MAX_LEN = 512
 OVERLAP = 128
 STRIDE = MAX_LEN - OVERLAP
 
-def process_image(image_path: str, page_id: int, doc_id: str, ocr="doctr"):
-    pil = Image.open(image_path).convert("RGB")
-    w, h = pil.size
+def warmup(ocr="doctr", tables="reuse"):
+    """
+    Load the models up front instead of on the first page: the docTR predictor
+    (unless ocr="tesseract"), img2table (unless tables="off") and the LayoutLMv3 processor.
+    """
+    if ocr != "tesseract":
+        get_model()
+    if tables != "off":
+        import src.parsing.img2table_adapters  # noqa: F401
+    get_processor()
 
-    # ---- 1. OCR ----
-    if ocr=="doctr":
-       tokens_raw = ocr_doctr(image_path)
-    else:
-       tokens_raw = ocr_pytesseract(image_path)
-    if not tokens_raw:
-        return []
 
-    # ---- 2. Normalize bounding boxes ----
-    tokens_norm = normalize_bboxes(tokens_raw, (w, h))
-    words = [t['word'] for t in tokens_norm]
-    bboxes = [t['bbox'] for t in tokens_norm]
+def chunk_labelled_pages(batch_words, batch_bboxes, batch_labels, image_paths, page_ids, doc_id: str,
+                         batch_line_ids=None, chunking="sliding"):
+    """
+    Tokenize (one batched tokenizer call) and chunk pages that are already
+    normalized and labelled. `batch_line_ids` (each word's line, per page) is
+    used by chunking="lines". Returns each page's chunk entries; pages without
+    words get an empty list.
+    """
+    results = [[] for _ in page_ids]
+    kept = [i for i, words in enumerate(batch_words) if len(words)]
+    if not kept:
+        return results
 
-    # ---- 3. Synthetic labels ----
-    word_labels = synthetic_labeling(tokens_norm)
-   # word_labels = convert_B_to_I(word_labels, LABEL_MAP)
-
-    # ---- 4. Tokenization & alignment ----
-    encoding, aligned_labels, token_bboxes = tokenize_and_align_labels(words, bboxes, word_labels)
-
-    # ---- 5. Get token-level words (aligned with input_ids) ----
-    word_ids = encoding.word_ids()
-    token_words = []
-    for idx in word_ids:
-        if idx is None:
-            token_words.append("[SPECIAL]")  # for [CLS], [SEP], etc.
-        else:
-            token_words.append(words[idx])
+    # ---- 4. Tokenization & alignment (+ token-level words) ----
+    tokenized = tokenize_and_align_batch([list(batch_words[i]) for i in kept], [batch_bboxes[i] for i in kept],
+                                         [batch_labels[i] for i in kept])
 
-    # ---- 6. Chunking ----
-    chunks = sliding_window_chunks(
-        encoding, aligned_labels, token_bboxes, max_len=MAX_LEN, stride=STRIDE
-    )
+    for i, tok in zip(kept, tokenized):
+        line_ids = batch_line_ids[i] if batch_line_ids is not None else None
+        results[i] = entries_from_tokens(tok, image_paths[i], page_ids[i], doc_id, line_ids=line_ids,
+                                         chunking=chunking)
+    return results
 
-    # ---- 7. Build final output entries ----
-    results = []
+
+def entries_from_tokens(tok: Dict, image_path, page_id: int, doc_id: str, line_ids=None,
+                        chunking="sliding") -> List[Dict]:
+    """
+    Chunk one tokenized page (from tokenize_and_align_batch) into the final output entries.
+    chunking="sliding" uses fixed MAX_LEN / STRIDE windows; "lines" cuts only
+    at word / line boundaries (`line_ids`: each word's line) with adaptive overlap.
+    """
+    # ---- 5. Chunking ----
+    if chunking == "lines":
+        chunks = line_window_chunks(tok, tok["labels"], tok["bboxes"], line_ids=line_ids, max_len=MAX_LEN,
+                                    overlap=OVERLAP)
+    else:
+        chunks = sliding_window_chunks(
+            tok, tok["labels"], tok["bboxes"], max_len=MAX_LEN, stride=STRIDE
+        )
+
+    # ---- 6. Build final output entries ----
+    entries = []
     for i, ch in enumerate(chunks):
         # Determine token range in this chunk
         token_slice = slice(ch["start"], ch["end"])
-        chunk_words = token_words[token_slice]
+        chunk_words = tok["token_words"][token_slice]
 
         entry = {
             "id": f"{doc_id}_page{page_id}_chunk{i}",
             "image_path": str(image_path),
             "page": page_id,
             "words": chunk_words,                 # ✅ Added words for readability/debugging
-            "input_ids": ch["input_ids"],
-            "attention_mask": ch["attention_mask"],
-            "labels": ch["labels"],
-            "bboxes": ch["bboxes"]
+            "input_ids": ch["input_ids"].tolist(),
+            "attention_mask": ch["attention_mask"].tolist(),
+            "labels": ch["labels"].tolist(),
+            "bboxes": ch["bboxes"].tolist()
         }
-        results.append(entry)
+        entries.append(entry)
 
-    return results
+    return entries
+
+
+def build_page_entries(pages: List[PageTokens], image_paths, page_ids, doc_id: str, chunking="sliding"):
+    """
+    Run normalization, labelling, tokenization and chunking on several pages' OCR output.
+    All pages are tokenized in a single batched tokenizer call.
+    Returns each page's chunk entries (normalized boxes and labels are left on the pages).
+    """
+    # ---- 2. Normalize bounding boxes ----
+    # ---- 3. Synthetic labels ----
+    batch_words, batch_bboxes, batch_labels, batch_line_ids = [], [], [], []
+    for page in pages:
+        batch_line_ids.append(page.line_ids)
+        if not len(page):
+            batch_words.append([])
+            batch_bboxes.append([])
+            batch_labels.append([])
+            continue
+        normalize_page(page)
+        word_labels = synthetic_labeling(page)
+        # word_labels = convert_B_to_I(word_labels, LABEL_MAP)
+        batch_words.append(page.words)
+        batch_bboxes.append(page.norm_bboxes.tolist())
+        batch_labels.append(word_labels)
+
+    return chunk_labelled_pages(batch_words, batch_bboxes, batch_labels, list(image_paths), list(page_ids), doc_id,
+                                batch_line_ids=batch_line_ids, chunking=chunking)
+
+
+def build_entries_batch(pages: List[PageTokens], image_paths, page_ids, doc_id: str, chunking="sliding",
+                        pack: bool = False):
+    """
+    `build_page_entries`, flattened: the chunk entries of all pages, in page order.
+    With `pack=True` short chunks of consecutive pages share sequences (see `pack_entries`).
+    """
+    entries = [entry for page_entries in build_page_entries(pages, image_paths, page_ids, doc_id, chunking=chunking)
+               for entry in page_entries]
+    return pack_entries(entries, max_len=MAX_LEN) if pack else entries
+
+
+def build_entries(page: PageTokens, image_path, page_id: int, doc_id: str, chunking="sliding"):
+    """
+    Run normalization, labelling, tokenization and chunking on one page's OCR output.
+    Returns the list of chunk entries for that page.
+    """
+    return build_entries_batch([page], [image_path], [page_id], doc_id, chunking=chunking)
+
+
+def process_image(image_path: str, page_id: int, doc_id: str, ocr="doctr", tables="reuse", image: PageImage = None,
+                  chunking="sliding", adaptive: bool = False):
+    """
+    `image` is an optional in-memory copy of the page (PIL image or RGB array);
+    when given, `image_path` is only used as the page's name in the output.
+    """
+    with context(doc_id=doc_id, page=page_id), stage("process_image"):
+        rgb_page = load_page_image(image_path if image is None else image)
+
+        # ---- 1. OCR ----
+        if ocr=="doctr":
+           page = ocr_doctr_pages([rgb_page], batch_size=1, tables=tables, adaptive=adaptive)[0]
+        else:
+           page = ocr_tesseract_pages([rgb_page], tables=tables, adaptive=adaptive)[0]
+
+        return build_entries(page, image_path, page_id, doc_id, chunking=chunking)
+
+
+def process_images(image_paths, doc_id: str, page_ids=None, ocr="doctr", batch_size: int = DOCTR_BATCH_SIZE,
+                   tables="reuse", images=None, chunking="sliding", pack: bool = False, adaptive: bool = False):
+    """
+    Batched counterpart of `process_image` for a whole document.
+    docTR sees `batch_size` pages per forward pass instead of one, Tesseract
+    runs them in parallel; ocr="auto" picks the backend from the first pages.
+    `images` optionally holds the in-memory pages matching `image_paths`.
+    Returns the flattened chunk entries of all pages, in page order
+    (with `pack=True`, packed across the document, see `pack_entries`).
+    """
+    image_paths = list(image_paths)
+    images = image_paths if images is None else list(images)
+    if page_ids is None:
+        page_ids = range(len(image_paths))
+    page_ids = list(page_ids)
+
+    if ocr == "auto":
+        ocr = choose_ocr_backend(images[:AUTO_SAMPLE_PAGES])
+
+    results = []
+    for start in range(0, len(image_paths), batch_size):
+        batch_paths = image_paths[start:start + batch_size]
+        pages = ocr_pages(images[start:start + batch_size], ocr=ocr, batch_size=batch_size, tables=tables,
+                          adaptive=adaptive)
+        results.extend(build_entries_batch(pages, batch_paths, page_ids[start:start + batch_size], doc_id,
+                                           chunking=chunking))
+    return pack_entries(results, max_len=MAX_LEN) if pack else results
+
+
+def _page_name(pdf_path: str, page_index: int, IMAGES_DIR: str = None, img=None) -> str:
+    """Page name used as `image_path`; the PNG is written only when IMAGES_DIR is set."""
+    name = f"{Path(pdf_path).stem}_page_{page_index:03d}.png"
+    if not IMAGES_DIR:
+        return name
+    out_dir = Path(IMAGES_DIR)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    if img is not None:
+        img.save(out_dir / name)  # optional side output
+    return str(out_dir / name)
+
+
+def ocr_pages(rgb_pages, ocr="doctr", batch_size: int = DOCTR_BATCH_SIZE, tables="reuse",
+              ocr_workers: int = None, adaptive: bool = False) -> List[PageTokens]:
+    """
+    OCR in-memory RGB pages with the chosen backend. Tesseract runs up to
+    `ocr_workers` pages at once (default: one per core). `adaptive` runs
+    table detection on downscaled copies of the pages (see `ocr_doctr_pages`).
+    """
+    return [page_from_layout(layout) for layout in ocr_page_layouts(
+        rgb_pages, ocr=ocr, batch_size=batch_size, tables=tables, ocr_workers=ocr_workers, adaptive=adaptive)]
+
+
+def ocr_page_layouts(rgb_pages, ocr="doctr", batch_size: int = DOCTR_BATCH_SIZE, tables="reuse",
+                     ocr_workers: int = None, adaptive: bool = False) -> List[Dict]:
+    """The measured page layouts behind `ocr_pages`, i.e. the OCR stage's output."""
+    if ocr == "doctr":
+        return doctr_page_layouts(rgb_pages, batch_size=batch_size, tables=tables, adaptive=adaptive)
+    workers = ocr_workers or min(len(rgb_pages), os.cpu_count() or 1)
+    return tesseract_page_layouts(rgb_pages, tables=tables, workers=workers, adaptive=adaptive)
+
+
+def ocr_pdf_pages(pdf_path: str, page_ids: List[int], rgb_pages, ocr="doctr", batch_size: int = DOCTR_BATCH_SIZE,
+                  tables="reuse", text_layer: bool = False, poppler_path=None,
+                  ocr_workers: int = None, adaptive: bool = False) -> List[PageTokens]:
+    """
+    `ocr_pages` for rendered pages of one PDF. With `text_layer=True` the words
+    of born-digital pages come from the PDF's own text layer; only pages
+    without a usable one (scans, image-only pages) are OCR'd.
+    """
+    return [page_from_layout(layout) for layout in ocr_pdf_layouts(
+        pdf_path, page_ids, rgb_pages, ocr=ocr, batch_size=batch_size, tables=tables, text_layer=text_layer,
+        poppler_path=poppler_path, ocr_workers=ocr_workers, adaptive=adaptive)]
+
+
+def ocr_pdf_layouts(pdf_path: str, page_ids: List[int], rgb_pages, ocr="doctr", batch_size: int = DOCTR_BATCH_SIZE,
+                    tables="reuse", text_layer: bool = False, poppler_path=None,
+                    ocr_workers: int = None, adaptive: bool = False) -> List[Dict]:
+    """The measured page layouts behind `ocr_pdf_pages`, i.e. the OCR stage's output."""
+    pages = [None] * len(rgb_pages)
+    if text_layer and page_ids:
+        with stage("read_text_layer", pages=len(page_ids)):
+            layers = read_text_layer(pdf_path, min(page_ids) + 1, max(page_ids) + 1, poppler_path=poppler_path)
+        for i, (page_id, rgb_page) in enumerate(zip(page_ids, rgb_pages)):
+            layer = layers.get(page_id)
+            if layer is not None and has_text_layer(layer, rgb_page):
+                with stage("text_layer"):
+                    pages[i] = word_layer_layout(layer, rgb_page, tables=tables, adaptive=adaptive)
+        count("text_layer_pages", sum(page is not None for page in pages))
+
+    missing = [i for i, page in enumerate(pages) if page is None]
+    if missing:
+        ocr_results = ocr_page_layouts([rgb_pages[i] for i in missing], ocr=ocr, batch_size=batch_size,
+                                       tables=tables, ocr_workers=ocr_workers, adaptive=adaptive)
+        for i, page in zip(missing, ocr_results):
+            pages[i] = page
+    return pages
+
+
+def process_pdf(pdf_path: str, doc_id: str, IMAGES_DIR: str = None, ocr="doctr", batch_size: int = DOCTR_BATCH_SIZE,
+                tables="reuse", dpi: int = 200, poppler_path=None, text_layer: bool = False, chunking="sliding",
+                pack: bool = False, adaptive: bool = False):
+    """
+    Stream a PDF through the pipeline: pages are rasterized in the background
+    and OCR'd `batch_size` at a time, so the whole document is never held as
+    images in memory. Pages are handed over in memory; PNGs are only written
+    when `IMAGES_DIR` is set. With `text_layer=True`, pages that carry a PDF
+    text layer use it instead of OCR (see `ocr_pdf_pages`). ocr="auto" picks
+    docTR or Tesseract for the document from its first pages (`choose_ocr_backend`).
+    `chunking` / `pack` are passed on to `build_entries_batch` (packing works
+    within each batch of `batch_size` pages). `adaptive=True` runs table
+    detection at a per-page reduced resolution (see `ocr_doctr_pages`).
+    Yields (chunk entries, {image_path: RGB page array}) per page batch, so
+    callers can highlight the pages without decoding them again.
+    """
+    def run(batch):
+        nonlocal ocr
+        page_ids = [i for i, _, _ in batch]
+        names = [name for _, name, _ in batch]
+        rgb_pages = [rgb for _, _, rgb in batch]
+        if ocr == "auto":
+            ocr = choose_ocr_backend(rgb_pages[:AUTO_SAMPLE_PAGES])
+        pages = ocr_pdf_pages(pdf_path, page_ids, rgb_pages, ocr=ocr, batch_size=batch_size, tables=tables,
+                              text_layer=text_layer, poppler_path=poppler_path, adaptive=adaptive)
+        entries = build_entries_batch(pages, names, page_ids, doc_id, chunking=chunking, pack=pack)
+        return entries, dict(zip(names, rgb_pages))
+
+    with context(doc_id=doc_id, pdf=Path(pdf_path).stem):
+        rendered = prefetch(iter_pdf_images(pdf_path, dpi=dpi, poppler_path=poppler_path,
+                                            pages_per_batch=batch_size), depth=batch_size)
+        batch = []
+        try:
+            for i, img in rendered:
+                batch.append((i, _page_name(pdf_path, i, IMAGES_DIR, img), load_page_image(img)))
+                img.close()
+                if len(batch) == batch_size:
+                    yield run(batch)
+                    batch = []
+            if batch:
+                yield run(batch)
+        finally:
+            rendered.close()  # stops the rendering thread when the caller gives up early
+
+
+# ---------------- headless batch runner ----------------
+def _init_worker(torch_threads: int, ocr: str, tables: str, ocr_cache_dir: str = None, events_path: str = None,
+                 profile: str = None, profile_dir: str = None):
+    """Process-pool initializer: pin this worker's torch threads and load its models once."""
+    if ocr_cache_dir:
+        configure_ocr_cache(ocr_cache_dir)
+    if events_path or profile:
+        configure_instrumentation(events_path, profile=profile, profile_dir=profile_dir)
+    if ocr != "tesseract":
+        import torch
+        torch.set_num_threads(torch_threads)
+    warmup(ocr=ocr, tables=tables)
+
+
+def stage_configs(ocr="doctr", tables="reuse", dpi: int = 200, images_dir: str = None,
+                  text_layer: bool = False, chunking="sliding", adaptive: bool = False) -> Dict[str, str]:
+    """
+    Configuration fingerprint of each pipeline stage, chained so that a change
+    re-runs that stage and everything after it. Each stage hashes the source of
+    the code that produces its artifact: the OCR stage the word / line / table
+    extraction and line measurements, the label stage only the header, table
+    assignment and labelling rules, and the chunk stage the tokenizer module,
+    the chunking strategy and MAX_LEN / STRIDE. Editing a header rule thus
+    re-labels from the stored layouts without OCR-ing the pages again.
+    """
+    import inspect
+    import src.labelling.synthetic_labelling
+    import src.parsing.geometry
+    import src.parsing.ocr as ocr_module
+    import src.parsing.resolution
+    import src.parsing.tables
+    import src.parsing.text_layer
+    import src.tokenizer.tokenizer
+
+    def source(*objects):
+        return config_digest(*(inspect.getsource(o) for o in objects))
+
+    ocr_fp = doctr_fingerprint(tables, adaptive=adaptive) if ocr == "doctr" else tesseract_fingerprint()
+    configs = {"rasterize": config_digest(dpi, images_dir)}
+    configs["ocr"] = config_digest(dpi, ocr_fp, tables, text_layer and text_layer_fingerprint(), adaptive, source(
+        ocr_module.doctr_page_words, ocr_module._doctr_page_layout, ocr_module._tesseract_raw,
+        ocr_module._tesseract_layer, ocr_module.measure_page, ocr_module.ink_ratio, ocr_module.to_gray_array,
+        src.parsing.tables.detect_tables, src.parsing.text_layer, src.parsing.resolution, src.parsing.geometry))
+    configs["label"] = config_digest(configs["ocr"], ocr_module.BOLD_INK_RATIO, ocr_module.NUMERIC_HEADER_RE.pattern,
+                                     ocr_module.ROMAN_HEADER_RE.pattern, ocr_module.ALPHA_HEADER_RE.pattern, source(
+        ocr_module.page_from_layout, ocr_module.is_header_line, ocr_module.check_headers,
+        src.parsing.tables.assign_tables, src.labelling.synthetic_labelling))
+    configs["chunk"] = config_digest(configs["label"], MODEL_NAME, MAX_LEN, STRIDE, chunking, images_dir,
+                                     source(src.tokenizer.tokenizer))
+    return configs
+
+
+def _process_page_range(task):
+    """
+    Worker task: rasterize one page range of one PDF, run the whole pipeline on
+    it and write each page's layout, label and chunk artifacts.
+    Returns (doc_id, stages run, [(page_id, entries), ...]).
+    """
+    doc_id, pdf_path, first_page, last_page, save_images, opts = task
+    with context(doc_id=doc_id, pdf=Path(pdf_path).stem, first_page=first_page), stage("page_range"):
+        images = pdf_page_range(pdf_path, first_page, last_page, dpi=opts["dpi"], poppler_path=opts["poppler_path"])
+        page_ids = list(range(first_page - 1, last_page))
+        for i, img in zip(page_ids, images):
+            if i in save_images:
+                _page_name(pdf_path, i, opts["images_dir"], img)  # writes the PNG
+        rgb_pages = [load_page_image(img) for img in images]
+        # the pool already runs one task per core, so Tesseract OCRs this range's pages one at a time
+        layouts = ocr_pdf_layouts(pdf_path, page_ids, rgb_pages, ocr=opts["ocr"], batch_size=opts["pages_per_task"],
+                                  tables=opts["tables"], text_layer=opts["text_layer"],
+                                  poppler_path=opts["poppler_path"], ocr_workers=1, adaptive=opts["adaptive"])
+        for page_id, layout in zip(page_ids, layouts):
+            save_layout(artifact_path(opts["out_dir"], doc_id, page_id, "layout.npz"), layout)
+        return _label_pages(doc_id, pdf_path, page_ids, layouts, opts, STAGES)
+
+
+def _relabel_pages(task):
+    """
+    Worker task: re-run the header / table / labelling rules and chunking on
+    pages from their stored layout artifacts, without rasterizing or OCR-ing
+    them again.
+    Returns (doc_id, stages run, [(page_id, entries), ...]).
+    """
+    doc_id, pdf_path, page_ids, opts = task
+    with context(doc_id=doc_id, pdf=Path(pdf_path).stem):
+        layouts = [load_layout(artifact_path(opts["out_dir"], doc_id, i, "layout.npz")) for i in page_ids]
+    return _label_pages(doc_id, pdf_path, page_ids, layouts, opts, ("label", "chunk"))
+
+
+def _label_pages(doc_id, pdf_path, page_ids, layouts, opts, stages):
+    """Label and chunk measured page layouts and write each page's label and chunk artifacts."""
+    with context(doc_id=doc_id, pdf=Path(pdf_path).stem), stage("label", pages=len(page_ids)):
+        pages = [page_from_layout(layout) for layout in layouts]
+        names = [_page_name(pdf_path, i, opts["images_dir"]) for i in page_ids]
+        per_page = build_page_entries(pages, names, page_ids, doc_id, chunking=opts["chunking"])
+
+    for page_id, page, entries in zip(page_ids, pages, per_page):
+        save_labels(artifact_path(opts["out_dir"], doc_id, page_id, "labels.npz"), page.words,
+                    page.norm_bboxes if page.norm_bboxes is not None else np.zeros((0, 4)),
+                    page.labels if page.labels is not None else np.zeros(0), line_ids=page.line_ids)
+        save_chunks(artifact_path(opts["out_dir"], doc_id, page_id, "chunks.json"), entries)
+    return doc_id, stages, list(zip(page_ids, per_page))
+
+
+def _rechunk_pages(task):
+    """
+    Worker task: re-tokenize and re-chunk pages from their stored label
+    artifacts, without rasterizing or OCR-ing them again.
+    Returns (doc_id, stages run, [(page_id, entries), ...]).
+    """
+    doc_id, pdf_path, page_ids, opts = task
+    with context(doc_id=doc_id, pdf=Path(pdf_path).stem), stage("rechunk", pages=len(page_ids)):
+        labelled = [load_labels(artifact_path(opts["out_dir"], doc_id, i, "labels.npz")) for i in page_ids]
+        names = [_page_name(pdf_path, i, opts["images_dir"]) for i in page_ids]
+        per_page = chunk_labelled_pages([rec["words"] for rec in labelled],
+                                        [rec["norm_bboxes"].tolist() for rec in labelled],
+                                        [rec["labels"].tolist() for rec in labelled], names, page_ids, doc_id,
+                                        batch_line_ids=[rec.get("line_ids") for rec in labelled],
+                                        chunking=opts["chunking"])
+    for page_id, entries in zip(page_ids, per_page):
+        save_chunks(artifact_path(opts["out_dir"], doc_id, page_id, "chunks.json"), entries)
+    return doc_id, ("chunk",), list(zip(page_ids, per_page))
+
+
+def choose_document_backend(pdf_path: str, n_pages: int, dpi: int = 200, poppler_path=None) -> str:
+    """
+    ocr="auto" for one PDF: `choose_ocr_backend` on AUTO_SAMPLE_PAGES pages
+    spread over the document, rendered at the build's DPI (so the sampled
+    Tesseract results are OCR cache hits later if Tesseract is chosen).
+    """
+    n_sample = min(AUTO_SAMPLE_PAGES, n_pages)
+    sample = sorted({round(i * (n_pages - 1) / max(n_sample - 1, 1)) for i in range(n_sample)})
+    with context(pdf=Path(pdf_path).stem), stage("choose_ocr", pages=len(sample)):
+        images = [pdf_page_range(pdf_path, i + 1, i + 1, dpi=dpi, poppler_path=poppler_path)[0] for i in sample]
+        return choose_ocr_backend(images)
+
+
+def _page_runs(pages: List[int], max_len: int):
+    """Split sorted page indices into contiguous (first, last) runs of at most `max_len` pages."""
+    runs = []
+    for page in pages:
+        if runs and page == runs[-1][1] + 1 and page - runs[-1][0] < max_len:
+            runs[-1][1] = page
+        else:
+            runs.append([page, page])
+    return [tuple(run) for run in runs]
+
+
+def write_document_csv(entries, out_path):
+    """One CSV per document, same layout as the notebook outputs in `output/`."""
+    import pandas as pd
+    pd.DataFrame(entries).to_csv(out_path, index=False)
+
+
+def run_batch(pdf_paths, out_dir: str, workers: int = None, torch_threads: int = 1,
+              pages_per_task: int = DOCTR_BATCH_SIZE, images_dir: str = None, ocr="doctr", tables="reuse",
+              dpi: int = 200, poppler_path=None, ocr_cache_dir: str = None, output_format: str = "parquet",
+              rows_per_shard: int = 50_000, rebuild: bool = False, events_path: str = None, profile: str = None,
+              profile_dir: str = None, text_layer: bool = False, chunking="sliding", pack: bool = False,
+              adaptive: bool = False):
+    """
+    Process many PDFs on a process pool. Work is split into page ranges of
+    `pages_per_task` pages across all documents, so workers stay busy across
+    document boundaries. Each document is written as soon as all of its ranges
+    are done: appended to the Parquet shards `<out_dir>/chunks-*.parquet`
+    (output_format="parquet"), to the fixed-width memmap token store in
+    `<out_dir>` ("memmap", see src.dataset.memmap_store), or as
+    `<out_dir>/<stem>_output.csv` ("csv").
+
+    Builds are resumable: `<out_dir>/manifest.sqlite` records which stages each
+    page completed (see src.dataset.manifest). A rerun skips finished pages,
+    redoes only the stages whose input or configuration changed (an edited
+    header rule only re-labels from the stored OCR layouts, a new STRIDE only
+    re-chunks from the stored labels) and appends only new PDFs to the
+    existing output; if a document already in the output changed, the output
+    is rewritten from the stored chunks. `rebuild=True` starts from scratch.
+    With `text_layer=True`, born-digital pages use the PDF's text layer and
+    only scanned / image-only pages are OCR'd. With ocr="auto" each document
+    gets docTR or Tesseract (`choose_document_backend`); the choice is kept in
+    the manifest until the PDF changes.
+
+    `chunking` picks the window strategy (see `entries_from_tokens`);
+    `pack=True` packs each document's short chunks into shared sequences
+    (see `pack_entries`). The sequence count and packing efficiency of what
+    was written are stored in the manifest (meta "sequence_stats") and
+    emitted as instrumentation events. `adaptive=True` enables the
+    adaptive-resolution table detection of `ocr_doctr_pages`.
+
+    `events_path` / `profile` / `profile_dir` set up src.instrumentation in
+    this process and in every worker (JSON-lines events, cProfile stages).
+    Returns the list of written output paths.
+    """
+    pdf_paths = [str(p) for p in pdf_paths]
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    workers = workers or max(1, (os.cpu_count() or 1) // torch_threads)
+    opts = {"dpi": dpi, "poppler_path": poppler_path, "images_dir": images_dir, "ocr": ocr,
+            "tables": tables, "pages_per_task": pages_per_task, "out_dir": str(out_dir), "text_layer": text_layer,
+            "chunking": chunking, "adaptive": adaptive}
+
+    if events_path or profile:
+        configure_instrumentation(events_path, profile=profile, profile_dir=profile_dir)
+    manifest = BuildManifest(out_dir)
+    if rebuild:
+        manifest.reset()
+
+    # ---- OCR backend per document: fixed, or chosen by the ocr="auto" policy ----
+    registered = []
+    for pdf_path in pdf_paths:
+        n_pages = pdf_page_count(pdf_path, poppler_path=poppler_path)
+        input_hash = file_digest(pdf_path)
+        registered.append((pdf_path, n_pages, input_hash,
+                           manifest.document(str(Path(pdf_path).resolve()), input_hash, n_pages)))
+    backends = {doc_id: ocr for _, _, _, doc_id in registered}
+    if ocr == "auto":
+        policy = {doc_id: config_digest(input_hash, dpi, tesseract_fingerprint(), AUTO_SAMPLE_PAGES, AUTO_MIN_WORDS,
+                                        AUTO_MIN_CONFIDENCE)
+                  for _, _, input_hash, doc_id in registered}
+        for doc_id in backends:
+            chosen = manifest.get_meta(f"ocr_backend:{doc_id}")
+            backends[doc_id] = chosen["ocr"] if chosen and chosen["policy"] == policy[doc_id] else None
+        unresolved = [(pdf_path, n_pages, doc_id) for pdf_path, n_pages, _, doc_id in registered
+                      if backends[doc_id] is None]
+        if unresolved:
+            if ocr_cache_dir:
+                configure_ocr_cache(ocr_cache_dir)
+            # rendering and Tesseract are subprocesses, so threads sample documents in parallel;
+            # contexts are copied here so events from the workers keep the caller's fields
+            ctxs = [contextvars.copy_context() for _ in unresolved]
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                chosen = pool.map(lambda ctx, doc: ctx.run(choose_document_backend, doc[0], doc[1], dpi, poppler_path),
+                                  ctxs, unresolved)
+                for (_, _, doc_id), backend in zip(unresolved, chosen):
+                    backends[doc_id] = backend
+                    manifest.set_meta(f"ocr_backend:{doc_id}", {"ocr": backend, "policy": policy[doc_id]})
+            manifest.commit()
+    configs_by_ocr = {backend: stage_configs(ocr=backend, tables=tables, dpi=dpi, images_dir=images_dir,
+                                             text_layer=text_layer, chunking=chunking, adaptive=adaptive)
+                      for backend in set(backends.values())}
+
+    # ---- what is left to do, per page ----
+    docs, tasks = {}, []
+    for pdf_path, n_pages, input_hash, doc_id in registered:
+        configs = configs_by_ocr[backends[doc_id]]
+        doc_opts = dict(opts, ocr=backends[doc_id])
+
+        def done(page, stage):
+            return manifest.is_done(doc_id, page, stage, input_hash, configs[stage])
+
+        full, relabel, rechunk, save_images = [], [], [], set()
+        for page in range(n_pages):
+            if images_dir and not done(page, "rasterize"):
+                save_images.add(page)
+            if page in save_images or not done(page, "ocr"):
+                full.append(page)
+            elif not done(page, "label"):
+                relabel.append(page)
+            elif not done(page, "chunk"):
+                rechunk.append(page)
+        for first, last in _page_runs(full, pages_per_task):
+            tasks.append((_process_page_range, (doc_id, pdf_path, first + 1, last + 1, save_images, doc_opts)))
+        for start in range(0, len(relabel), pages_per_task):
+            tasks.append((_relabel_pages, (doc_id, pdf_path, relabel[start:start + pages_per_task], doc_opts)))
+        for start in range(0, len(rechunk), pages_per_task):
+            tasks.append((_rechunk_pages, (doc_id, pdf_path, rechunk[start:start + pages_per_task], doc_opts)))
+        docs[doc_id] = {"pdf_path": pdf_path, "input_hash": input_hash, "n_pages": n_pages, "configs": configs,
+                        "signature": config_digest(configs["chunk"], output_format, pack, input_hash),
+                        "pending": set(full) | set(relabel) | set(rechunk), "entries": {}}
+
+    # ---- which documents go to the output: new or changed ones, or all of them ----
+    rewrite = rebuild or (output_format != "csv" and any(
+        manifest.exported(d) not in (None, doc["signature"]) for d, doc in docs.items()))
+    if rewrite:
+        manifest.clear_exported()
+        manifest.set_meta("outputs", [])
+        manifest.commit()
+    to_export = {d for d, doc in docs.items() if manifest.exported(d) != doc["signature"]}
+
+    written, committed = [], manifest.get_meta("outputs", [])
+    totals = {"chunks": 0, "sequences": 0, "tokens": 0}
+    shard_writer = store_writer = None
+    if output_format == "parquet":
+        from src.dataset.parquet_writer import ParquetShardWriter
+        for path in out_dir.glob("chunks-*.parquet"):  # left behind by an interrupted run
+            if str(path) not in committed:
+                path.unlink()
+        shard_writer = ParquetShardWriter(out_dir, rows_per_shard=rows_per_shard, overwrite=rewrite)
+    elif output_format == "memmap":
+        from src.dataset.memmap_store import MemmapStoreWriter
+        store_writer = MemmapStoreWriter(out_dir, max_len=MAX_LEN, pad_id=get_processor().tokenizer.pad_token_id,
+                                         overwrite=rewrite)
+
+    def write(doc_id):
+        doc = docs[doc_id]
+        doc_entries = []
+        for page in range(doc["n_pages"]):
+            page_entries = doc["entries"].get(page)
+            if page_entries is None:
+                page_entries = load_chunks(artifact_path(out_dir, doc_id, page, "chunks.json"))
+            doc_entries.extend(page_entries)
+        doc["entries"] = {}
+        totals["chunks"] += len(doc_entries)
+        if pack:
+            doc_entries = pack_entries(doc_entries, max_len=MAX_LEN)
+        stats = sequence_stats(doc_entries, max_len=MAX_LEN)
+        totals["sequences"] += stats["sequences"]
+        totals["tokens"] += stats["tokens"]
+        count("sequences", stats["sequences"])
+        count("sequence_tokens", stats["tokens"])
+
+        if shard_writer is not None:
+            shard_writer.write(doc_entries)
+            return
+        if store_writer is not None:
+            store_writer.add_entries(doc_entries)
+            return
+        out_path = out_dir / f"{Path(doc['pdf_path']).stem}_output.csv"
+        write_document_csv(doc_entries, out_path)
+        written.append(out_path)
+
+    def emit(doc_id):
+        with context(doc_id=doc_id, pdf=Path(docs[doc_id]["pdf_path"]).stem), stage("write_output"):
+            write(doc_id)
+
+    for doc_id in sorted(to_export):  # nothing left to compute for these
+        if not docs[doc_id]["pending"]:
+            emit(doc_id)
+
+    if tasks:
+        ctx = mp.get_context("spawn")
+        worker_ocr = "doctr" if "doctr" in backends.values() else "tesseract"  # what the workers preload
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_worker,
+                                 initargs=(torch_threads, worker_ocr, tables, ocr_cache_dir, events_path, profile,
+                                           profile_dir)) as pool:
+            futures = [pool.submit(fn, task) for fn, task in tasks]
+            for n_done, future in enumerate(as_completed(futures), 1):
+                gauge("pending_tasks", len(futures) - n_done)
+                doc_id, stages, results = future.result()
+                doc = docs[doc_id]
+                for page_id, entries in results:
+                    artifacts = {
+                        "rasterize": Path(_page_name(doc["pdf_path"], page_id, images_dir)) if images_dir else "",
+                        "ocr": artifact_path(out_dir, doc_id, page_id, "layout.npz"),
+                        "label": artifact_path(out_dir, doc_id, page_id, "labels.npz"),
+                        "chunk": artifact_path(out_dir, doc_id, page_id, "chunks.json"),
+                    }
+                    for name in stages:
+                        manifest.mark(doc_id, page_id, name, doc["input_hash"], doc["configs"][name],
+                                      artifacts.get(name, ""))
+                    doc["pending"].discard(page_id)
+                    if doc_id in to_export:
+                        doc["entries"][page_id] = entries
+                manifest.commit()
+                if doc_id in to_export and not doc["pending"]:
+                    emit(doc_id)
+
+    if shard_writer is not None:
+        shard_paths = shard_writer.close()
+        written.extend(shard_paths)
+        manifest.set_meta("outputs", committed + [str(p) for p in shard_paths])
+    if store_writer is not None:
+        written.append(store_writer.close())
+    for doc_id in to_export:
+        manifest.set_exported(doc_id, docs[doc_id]["signature"])
+    totals["efficiency"] = totals["tokens"] / (totals["sequences"] * MAX_LEN) if totals["sequences"] else 0.0
+    gauge("packing_efficiency", round(totals["efficiency"], 4))
+    manifest.set_meta("sequence_stats", totals)
+    manifest.close()
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build LayoutLM chunks for a directory of PDFs.")
+    parser.add_argument("pdf_dir", help="directory containing the input PDFs")
+    parser.add_argument("--out-dir", default="output", help="where Parquet shards / CSV files are written")
+    parser.add_argument("--format", default="parquet", choices=["parquet", "memmap", "csv"],
+                        help="Parquet shards (typed list columns), a memmap token store for training, "
+                             "or one stringified-list CSV per document")
+    parser.add_argument("--rows-per-shard", type=int, default=50_000)
+    parser.add_argument("--images-dir", default=None,
+                        help="where page PNGs are saved and `image_path` points (default: <out-dir>/images)")
+    parser.add_argument("--no-images", action="store_true",
+                        help="do not save page PNGs; `image_path` is then only a page name")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: cores / torch threads)")
+    parser.add_argument("--torch-threads", type=int, default=1, help="torch threads per worker")
+    parser.add_argument("--pages-per-task", type=int, default=DOCTR_BATCH_SIZE)
+    parser.add_argument("--ocr", default="doctr", choices=["doctr", "tesseract", "auto"],
+                        help="OCR backend; 'auto' picks docTR or Tesseract per document from sampled pages")
+    parser.add_argument("--tables", default="reuse", choices=list(TABLE_MODES))
+    parser.add_argument("--text-layer", action="store_true",
+                        help="take words from the PDF's own text layer where it has one; OCR only the other pages")
+    parser.add_argument("--chunking", default="sliding", choices=list(CHUNKING),
+                        help="'sliding': fixed 512-token windows with 128 tokens of overlap; 'lines': windows cut "
+                             "at word / line boundaries with whole lines as overlap")
+    parser.add_argument("--pack", action="store_true",
+                        help="pack short chunks of consecutive pages into shared 512-token sequences")
+    parser.add_argument("--adaptive-resolution", action="store_true",
+                        help="detect tables on per-page downscaled copies (scaled from the text height); "
+                             "docTR and bold checks still use the full --dpi page")
+    parser.add_argument("--dpi", type=int, default=200)
+    parser.add_argument("--poppler-path", default=None)
+    parser.add_argument("--ocr-cache-dir", default=None,
+                        help=f"persistent OCR result cache (default: ${CACHE_DIR_ENV} if set)")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="ignore the stage manifest in --out-dir and process every page again")
+    parser.add_argument("--events", default=None,
+                        help=f"append per-stage timing / counter events to this JSON-lines file (or ${EVENTS_ENV})")
+    parser.add_argument("--profile", default=None,
+                        help=f"cProfile these stages, comma separated or 'all' (or ${PROFILE_ENV})")
+    parser.add_argument("--profile-dir", default=None, help="where .prof files are written (default: profiles/)")
+    args = parser.parse_args(argv)
+
+    pdf_paths = sorted(Path(args.pdf_dir).glob("*.pdf"))
+    images_dir = None if args.no_images else args.images_dir or str(Path(args.out_dir) / "images")
+    written = run_batch(pdf_paths, args.out_dir, workers=args.workers, torch_threads=args.torch_threads,
+                        pages_per_task=args.pages_per_task, images_dir=images_dir, ocr=args.ocr,
+                        tables=args.tables, dpi=args.dpi, poppler_path=args.poppler_path,
+                        ocr_cache_dir=args.ocr_cache_dir, output_format=args.format,
+                        rows_per_shard=args.rows_per_shard, rebuild=args.rebuild, events_path=args.events,
+                        profile=args.profile, profile_dir=args.profile_dir, text_layer=args.text_layer,
+                        chunking=args.chunking, pack=args.pack, adaptive=args.adaptive_resolution)
+    for out_path in written:
+        print(f"Wrote {out_path}")
+    with BuildManifest(args.out_dir) as manifest:
+        stats = manifest.get_meta("sequence_stats")
+    if stats and stats["sequences"]:
+        print(f"{stats['chunks']} chunks -> {stats['sequences']} sequences, "
+              f"packing efficiency {stats['efficiency']:.1%} of {MAX_LEN}-token slots")
+
+
+if __name__ == "__main__":
+    main()
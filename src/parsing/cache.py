@@ -0,0 +1,194 @@
+import hashlib
+import io
+import os
+import threading
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional
+import numpy as np
+
+# Persistent, content-addressed cache of raw OCR / layout results.
+# Entries are keyed by a hash of the decoded page pixels plus a fingerprint of
+# the backend, model and parameters, and stored as one compressed .npz per page.
+# Header and table *rules* are not cached, only what the models produced, so
+# rule changes re-run in milliseconds on a warm cache.
+
+CACHE_DIR_ENV = "LAYOUTLM_OCR_CACHE"
+CACHE_MAX_MB_ENV = "LAYOUTLM_OCR_CACHE_MAX_MB"
+DEFAULT_MAX_MB = 2048
+# the directory size is rescanned after this many puts, or once this process has
+# written this share of max_bytes since the last scan, so writes by other workers
+# sharing the directory are seen and the cache stays near its cap
+RESCAN_EVERY = 64
+RESCAN_FRACTION = 0.05
+
+
+def page_digest(rgb_page: np.ndarray) -> str:
+    """Hash of the decoded page pixels (and shape), independent of the file it came from."""
+    arr = np.ascontiguousarray(rgb_page)
+    h = hashlib.blake2b(digest_size=16)
+    h.update(str(arr.shape).encode())
+    h.update(memoryview(arr).cast("B"))
+    return h.hexdigest()
+
+
+def cache_key(rgb_page: np.ndarray, fingerprint: str) -> str:
+    return hashlib.blake2b(f"{page_digest(rgb_page)}|{fingerprint}".encode(), digest_size=16).hexdigest()
+
+
+def pack_strings(strings: List[str]) -> Dict[str, np.ndarray]:
+    """Strings as one UTF-8 byte buffer + offsets, so .npz needs no pickling."""
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(b) for b in encoded])
+    return {"data": np.frombuffer(b"".join(encoded), dtype=np.uint8), "offsets": offsets}
+
+
+def unpack_strings(data: np.ndarray, offsets: np.ndarray) -> List[str]:
+    buf = data.tobytes()
+    bounds = offsets.tolist()
+    return [buf[a:b].decode("utf-8") for a, b in zip(bounds[:-1], bounds[1:])]
+
+
+def pack_arrays(record: Dict) -> Dict[str, np.ndarray]:
+    """Record of arrays and string lists -> flat dict of arrays for np.savez."""
+    arrays = {}
+    for name, value in record.items():
+        if isinstance(value, list):
+            packed = pack_strings(value)
+            arrays[f"{name}__data"] = packed["data"]
+            arrays[f"{name}__offsets"] = packed["offsets"]
+        else:
+            arrays[name] = np.asarray(value)
+    return arrays
+
+
+def unpack_arrays(arrays: Dict[str, np.ndarray]) -> Dict:
+    """Inverse of `pack_arrays`."""
+    record = {}
+    for name, value in arrays.items():
+        if name.endswith("__offsets"):
+            continue
+        if name.endswith("__data"):
+            base = name[:-len("__data")]
+            record[base] = unpack_strings(value, arrays[f"{base}__offsets"])
+        else:
+            record[name] = value
+    return record
+
+
+class OCRCache:
+    """
+    On-disk cache of per-page OCR results with size-bounded LRU eviction.
+    Access time is tracked through file mtimes, so several worker processes
+    can share one directory; writes are atomic (temp file + rename). Each
+    process adds its own writes to the last scanned size and rescans the
+    directory periodically (RESCAN_EVERY / RESCAN_FRACTION) to pick up the others'.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = DEFAULT_MAX_MB * 1024 * 1024):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._size = None  # scanned lazily
+        self._puts_since_scan = 0
+        self._bytes_since_scan = 0
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.npz"
+
+    def get(self, key: str) -> Optional[Dict[str, np.ndarray]]:
+        path = self._path(key)
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                arrays = {name: data[name] for name in data.files}
+        except (FileNotFoundError, OSError, ValueError):
+            return None
+        try:
+            os.utime(path)  # mark as recently used
+        except OSError:
+            pass
+        return arrays
+
+    def put(self, key: str, arrays: Dict[str, np.ndarray]) -> None:
+        buf = io.BytesIO()
+        np.savez_compressed(buf, **arrays)
+        payload = buf.getvalue()
+
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+        tmp.write_bytes(payload)
+        os.replace(tmp, path)
+
+        with self._lock:
+            self._puts_since_scan += 1
+            self._bytes_since_scan += len(payload)
+            if (self._size is None or self._puts_since_scan >= RESCAN_EVERY
+                    or self._bytes_since_scan >= RESCAN_FRACTION * self.max_bytes):
+                self._size = self._scan_size()
+            else:
+                self._size += len(payload)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _entries(self):
+        return list(self.cache_dir.glob("*/*.npz"))
+
+    def _scan_size(self) -> int:
+        self._puts_since_scan = self._bytes_since_scan = 0
+        size = 0
+        for p in self._entries():
+            try:
+                size += p.stat().st_size
+            except FileNotFoundError:  # evicted by another process meanwhile
+                pass
+        return size
+
+    def _evict(self) -> None:
+        """Drop least recently used entries until the cache is back under 90% of max_bytes."""
+        entries = []
+        for p in self._entries():
+            try:
+                st = p.stat()
+            except FileNotFoundError:  # removed by another process
+                continue
+            entries.append((st.st_mtime, st.st_size, p))
+        entries.sort()
+        size = sum(e[1] for e in entries)
+        target = int(self.max_bytes * 0.9)
+        for _, nbytes, p in entries:
+            if size <= target:
+                break
+            try:
+                p.unlink()
+            except FileNotFoundError:
+                pass
+            size -= nbytes
+        self._size = size
+        self._puts_since_scan = self._bytes_since_scan = 0
+
+
+_cache = None
+_cache_configured = False
+
+
+def configure_ocr_cache(cache_dir: Optional[str], max_mb: int = DEFAULT_MAX_MB) -> Optional[OCRCache]:
+    """Enable the OCR cache in `cache_dir` for this process (None disables it)."""
+    global _cache, _cache_configured
+    _cache = OCRCache(cache_dir, max_bytes=max_mb * 1024 * 1024) if cache_dir else None
+    _cache_configured = True
+    return _cache
+
+
+def get_ocr_cache() -> Optional[OCRCache]:
+    """
+    The process-wide OCR cache, or None when caching is off. Unless
+    `configure_ocr_cache` was called, it is enabled by setting the
+    LAYOUTLM_OCR_CACHE environment variable to a directory.
+    """
+    if not _cache_configured:
+        configure_ocr_cache(os.environ.get(CACHE_DIR_ENV),
+                            int(os.environ.get(CACHE_MAX_MB_ENV, DEFAULT_MAX_MB)))
+    return _cache
@@ -0,0 +1,50 @@
+from typing import Tuple
+import numpy as np
+
+# All conversions truncate toward zero like the original per-box `int(...)` casts,
+# so array results match the scalar code bit for bit.
+
+
+def relative_to_pixels(rel_bboxes, image_size: Tuple[int, int]) -> np.ndarray:
+    """(N,4) relative [x0, y0, x1, y1] in 0-1 (docTR geometry) -> int32 pixel boxes."""
+    w, h = image_size
+    rel = np.asarray(rel_bboxes, dtype=np.float64).reshape(-1, 4)
+    return np.trunc(rel * np.array([w, h, w, h], dtype=np.float64)).astype(np.int32)
+
+
+def pixels_to_layoutlm(bboxes, image_size: Tuple[int, int]) -> np.ndarray:
+    """
+    (N,4) pixel boxes -> int16 LayoutLMv3 boxes in 0-1000.
+    x0/y0 are clipped at 0 and x1/y1 at 1000, as in `normalize_bboxes`.
+    """
+    w, h = image_size
+    px = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+    norm = np.trunc(px / np.array([w, h, w, h], dtype=np.float64) * 1000)
+    norm[:, :2] = np.maximum(norm[:, :2], 0)
+    norm[:, 2:] = np.minimum(norm[:, 2:], 1000)
+    return norm.astype(np.int16)
+
+
+def relative_to_layoutlm(rel_bboxes, image_size: Tuple[int, int]) -> Tuple[np.ndarray, np.ndarray]:
+    """docTR relative geometry -> (pixel boxes, 0-1000 boxes) in one pass per page."""
+    pixels = relative_to_pixels(rel_bboxes, image_size)
+    return pixels, pixels_to_layoutlm(pixels, image_size)
+
+
+def layoutlm_to_pixels(norm_bboxes, image_size: Tuple[int, int]) -> np.ndarray:
+    """(N,4) 0-1000 boxes -> int32 pixel boxes."""
+    w, h = image_size
+    norm = np.asarray(norm_bboxes, dtype=np.float64).reshape(-1, 4)
+    return np.trunc(norm / 1000 * np.array([w, h, w, h], dtype=np.float64)).astype(np.int32)
+
+
+def rescale_pixels(bboxes, from_size: Tuple[int, int], to_size: Tuple[int, int]) -> np.ndarray:
+    """
+    (N,4) pixel boxes on an image of `from_size` -> int32 boxes on the same
+    page at `to_size`, rounded outwards (and clipped) so the box still covers
+    everything it covered before.
+    """
+    (fw, fh), (tw, th) = from_size, to_size
+    px = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4) * np.array([tw / fw, th / fh, tw / fw, th / fh])
+    out = np.concatenate([np.floor(px[:, :2]), np.ceil(px[:, 2:])], axis=1)
+    return np.clip(out, 0, [tw, th, tw, th]).astype(np.int32)
@@ -0,0 +1,40 @@
+from dataclasses import dataclass
+from functools import cached_property
+from types import SimpleNamespace
+from typing import List, Optional
+import numpy as np
+from img2table.document import Image as Img2TableImage
+from img2table.ocr import DocTR as Img2TableDocTR
+from img2table.ocr.base import OCRInstance
+
+# Imported lazily by src.parsing.tables.detect_tables.
+
+
+class CachedDocTROCR(OCRInstance):
+    """
+    img2table OCR adapter over an existing docTR result page, so table
+    detection does not load a second docTR model and OCR the page again.
+    """
+
+    def __init__(self, doctr_page):
+        self.doctr_page = doctr_page
+
+    def content(self, document):
+        # img2table only asks for the table pages of a single image, i.e. page 0
+        return SimpleNamespace(pages=[self.doctr_page])
+
+    def to_ocr_dataframe(self, content):
+        return Img2TableDocTR.to_ocr_dataframe(self, content)
+
+
+@dataclass
+class ArrayImage(Img2TableImage):
+    """img2table Image over an already decoded RGB page, skipping its own PNG decode."""
+    array: Optional[np.ndarray] = None
+
+    def validate_array(self, value, **_):
+        return value
+
+    @cached_property
+    def images(self) -> List[np.ndarray]:
+        return [self.array]
@@ -1,24 +1,101 @@
-import pytesseract
+import contextvars
+import importlib.metadata
+import io
+import os
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
 from PIL import Image as PILImage
-from typing import List, Dict, Tuple
-from doctr.io import DocumentFile
-from doctr.models import ocr_predictor
+from typing import List, Dict, Tuple, Iterable
 import numpy as np
-from img2table.document import Image as Img2TableImage
-from img2table.ocr import DocTR as Img2TableOCR
+from src.parsing.page_image import PageImage, load_page_image, page_size
+from src.parsing.tables import detect_tables, assign_tables
+from src.parsing.page_tokens import PageTokens
+from src.instrumentation import stage, count, gauge
+from src.parsing.geometry import relative_to_pixels, relative_to_layoutlm, pixels_to_layoutlm, rescale_pixels
+from src.parsing.resolution import detection_scale, downscale, TARGET_TEXT_HEIGHT, MIN_SCALE, MAX_SCALE
+from src.parsing.cache import get_ocr_cache, cache_key, pack_arrays, unpack_arrays
+from src.parsing.text_layer import to_doctr_page
 import re
 
-# load pretrained model
-model = ocr_predictor(pretrained=True)
+# pages fed through one docTR call; also used as the detection batch size
+DOCTR_BATCH_SIZE = 8
 
-def ocr_pytesseract(image_path: str) -> List[Dict]:
+# docTR predictor, built on first use by get_model() (torch + doctr are imported there)
+_model = None
+_model_lock = threading.Lock()
+
+
+def get_model():
+    """Return the process-wide docTR predictor, loading it once (thread-safe)."""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                from doctr.models import ocr_predictor
+                _model = ocr_predictor(pretrained=True, det_bs=DOCTR_BATCH_SIZE)
+    return _model
+
+
+def __getattr__(name):
+    # keeps `from src.parsing.ocr import model` working without loading at import time
+    if name == "model":
+        return get_model()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def package_version(package: str) -> str:
+    try:
+        return importlib.metadata.version(package)
+    except importlib.metadata.PackageNotFoundError:
+        return "unknown"
+
+
+def tesseract_fingerprint() -> str:
+    """Backend / parameter fingerprint that keys cached Tesseract results."""
+    return f"tesseract={package_version('pytesseract')}|image_to_data|lines"
+
+
+# ocr="auto": pages sampled per document and the Tesseract word count / mean confidence needed to use it
+AUTO_SAMPLE_PAGES = 2
+AUTO_MIN_WORDS = 20
+AUTO_MIN_CONFIDENCE = 85
+# threads per tesseract process unless OMP_THREAD_LIMIT is set; parallelism comes from running pages side by side
+TESSERACT_THREADS = 1
+
+
+def _tesseract_data(rgb_page: np.ndarray) -> Dict:
     """
-    Use pytesseract to extract word-level tokens + bboxes.
-    Returns list of dicts: [{'word': str, 'bbox': (x0,y0,x1,y1)} ...]
+    Tesseract's TSV output for one page as a dict of columns (what
+    pytesseract.image_to_data returns with Output.DICT). Tesseract is run
+    directly so its thread limit can be set for that process only, leaving
+    os.environ (and torch / other workers) untouched.
     """
-    # pytesseract image_to_data returns a TSV with bbox+text
-    data = pytesseract.image_to_data(Image.open(image_path), output_type=pytesseract.Output.DICT)
-    tokens = []
+    import pytesseract
+
+    buf = io.BytesIO()
+    PILImage.fromarray(rgb_page).save(buf, format="PNG", compress_level=1)
+    env = dict(os.environ)
+    env.setdefault("OMP_THREAD_LIMIT", str(TESSERACT_THREADS))
+    try:
+        proc = subprocess.run([pytesseract.pytesseract.tesseract_cmd, "stdin", "stdout", "tsv"],
+                              input=buf.getvalue(), capture_output=True, env=env)
+    except FileNotFoundError:
+        raise pytesseract.TesseractNotFoundError()
+    if proc.returncode:
+        raise pytesseract.TesseractError(proc.returncode, proc.stderr.decode("utf-8", "replace").strip())
+    return pytesseract.pytesseract.file_to_dict(proc.stdout.decode("utf-8"), "\t", -1)
+
+
+def _tesseract_raw(rgb_page: np.ndarray) -> Dict:
+    """
+    Raw Tesseract words, pixel boxes, confidences and (block, paragraph, line)
+    numbers of one page (what the OCR cache stores).
+    """
+    # tesseract's TSV has bbox+text per word
+    data = _tesseract_data(rgb_page)
+    words, bboxes, confs, line_keys = [], [], [], []
     n = len(data['level'])
     for i in range(n):
         text = data['text'][i].strip()
@@ -26,23 +103,157 @@ def ocr_pytesseract(image_path: str) -> List[Dict]:
         if not text:
             continue
         x, y, w, h = data['left'][i], data['top'][i], data['width'][i], data['height'][i]
-        bbox = (x, y, x + w, y + h)
-        if conf > 60 and (text.isupper() or h > 25):
-           tokens.append({'word': text, 'bbox': bbox, "header": True})
-        else:
-           tokens.append({'word': text, 'bbox': bbox, "header": False})
-    return tokens
+        words.append(text)
+        bboxes.append((x, y, x + w, y + h))
+        confs.append(conf)
+        line_keys.append((data['block_num'][i], data['par_num'][i], data['line_num'][i]))
+    return {
+        "words": words,
+        "bboxes": np.asarray(bboxes, dtype=np.int32).reshape(-1, 4),
+        "conf": np.asarray(confs, dtype=np.int32),
+        "line_keys": np.asarray(line_keys, dtype=np.int32).reshape(-1, 3),
+    }
+
+
+def _tesseract_page_raw(rgb_page: np.ndarray) -> Dict:
+    """`_tesseract_raw` through the OCR cache."""
+    cache = get_ocr_cache()
+    key = cache_key(rgb_page, tesseract_fingerprint()) if cache else None
+    hit = cache.get(key) if cache else None
+    if hit is not None:
+        count("ocr_cache_hits")
+        return unpack_arrays(hit)
+    with stage("ocr_tesseract", pages=1):
+        raw = _tesseract_raw(rgb_page)
+    if cache:
+        cache.put(key, pack_arrays(raw))
+    return raw
+
+
+def _tesseract_layer(raw: Dict, image_size: Tuple[int, int]) -> Dict:
+    """
+    Tesseract words grouped into blocks and lines by their block / paragraph /
+    line numbers, in the page format of src.parsing.text_layer.
+    Boxes are shifted to pixel centres, so the relative -> pixel round trip in
+    page_from_layout truncates back to Tesseract's integer boxes.
+    """
+    blocks, prev_block, prev_line = [], None, None
+    for word, box, key in zip(raw["words"], raw["bboxes"].tolist(), raw["line_keys"].tolist()):
+        if key[0] != prev_block:
+            blocks.append([])
+            prev_block, prev_line = key[0], None
+        if key != prev_line:
+            blocks[-1].append([])
+            prev_line = key
+        blocks[-1][-1].append((word, tuple(v + 0.5 for v in box)))
+    width, height = image_size
+    return {"width": width, "height": height, "blocks": blocks}
+
+
+def ocr_tesseract_pages(images: Iterable, tables: str = "reuse", workers: int = 1,
+                        adaptive: bool = False) -> List[PageTokens]:
+    """
+    Tesseract counterpart of `ocr_doctr_pages`: words are grouped into lines
+    from image_to_data's block / paragraph / line numbers, and the same table
+    detection and `check_headers` rules are applied. Up to `workers` Tesseract
+    processes run at once, each limited to OMP_THREAD_LIMIT threads
+    (TESSERACT_THREADS unless set in the environment). Tesseract reads the full-resolution page;
+    `adaptive` only moves table detection to a downscaled copy.
+    Returns one PageTokens per page.
+    """
+    return [page_from_layout(layout)
+            for layout in tesseract_page_layouts(images, tables=tables, workers=workers, adaptive=adaptive)]
+
+
+def tesseract_page_layouts(images: Iterable, tables: str = "reuse", workers: int = 1,
+                           adaptive: bool = False) -> List[Dict]:
+    """The measured page layouts behind `ocr_tesseract_pages` (see `measure_page`)."""
+    rgb_pages = [load_page_image(img) for img in images]
+    if workers > 1 and len(rgb_pages) > 1:
+        # each page is one tesseract subprocess, so threads are enough to run them in parallel;
+        # contexts are copied here so stage events keep the caller's doc_id / page
+        ctxs = [contextvars.copy_context() for _ in rgb_pages]
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            raws = list(pool.map(lambda ctx, rgb: ctx.run(_tesseract_page_raw, rgb), ctxs, rgb_pages))
+    else:
+        raws = [_tesseract_page_raw(rgb) for rgb in rgb_pages]
+
+    return [word_layer_layout(_tesseract_layer(raw, page_size(rgb)), rgb, tables=tables, adaptive=adaptive)
+            for raw, rgb in zip(raws, rgb_pages)]
+
+
+def ocr_pytesseract(image_path: PageImage, tables: str = "reuse") -> List[Dict]:
+    """
+    Use pytesseract to extract word-level tokens + bboxes + header + table flag.
+    `image_path` may also be an in-memory page (PIL image or RGB array).
+    Returns the same per-word dicts as `ocr_doctr` (see `ocr_tesseract_pages`).
+    """
+    return ocr_tesseract_pages([image_path], tables=tables)[0].to_dicts()
+
+
+def choose_ocr_backend(sample_pages: Iterable) -> str:
+    """
+    Cost / quality policy behind ocr="auto": Tesseract is several times cheaper
+    on CPU, so a document goes to it when Tesseract reads its sample pages
+    confidently (clean, born-digital-like scans); anything else (low
+    confidence, handwriting, photos, too little text to tell) goes to docTR.
+    The Tesseract results land in the OCR cache, so they are reused if chosen.
+    """
+    confs = [_tesseract_page_raw(load_page_image(img))["conf"] for img in sample_pages]
+    confs = np.concatenate(confs) if confs else np.zeros(0)
+    if len(confs) >= AUTO_MIN_WORDS and confs.mean() >= AUTO_MIN_CONFIDENCE:
+        return "tesseract"
+    return "doctr"
+
+# --- Header patterns (compiled once) ---
+NUMERIC_HEADER_RE = re.compile(r'^\d+(\.\d+)*[\.\)]?\s')
+ROMAN_HEADER_RE = re.compile(r'^(?=[MDCLXVI])M{0,4}(CM|CD|D?C{0,3})'
+                             r'(XC|XL|L?X{0,3})(IX|IV|V?I{0,3})[\.\)\-]\s', re.IGNORECASE)
+ALPHA_HEADER_RE = re.compile(r'^[A-Z][\.\)\-]\s')
+
+
+def to_gray_array(image) -> np.ndarray:
+    """
+    Grayscale uint8 view of a page, shared by every is_bold check on that page.
+    Accepts a PIL image, an RGB array or an already-gray (H, W) array.
+    """
+    if isinstance(image, np.ndarray):
+        if image.ndim == 2:
+            return image
+        image = PILImage.fromarray(image)
+    return np.asarray(image.convert("L"))
+
+
+BOLD_INK_RATIO = 0.15  # a line with more dark pixels than this reads as bold; tune threshold
+
+
+def ink_ratio(image, bbox) -> float:
+    """
+    Fraction of dark pixels in the box. `image` is a PIL image, a grayscale
+    array from `to_gray_array` or the full-resolution RGB page array; only
+    the box's crop is converted.
+    """
+    x0, y0, x1, y1 = bbox
+    if isinstance(image, np.ndarray):
+        arr = image[y0:y1, x0:x1]
+        if arr.size == 0:
+            return 0.0
+        arr = to_gray_array(arr)
+    else:
+        arr = to_gray_array(image.crop(tuple(bbox)))
+    if arr.size == 0:
+        return 0.0
+    return float((arr < 128).mean())  # fraction of dark pixels
+
 
 def is_bold(image, bbox):
-    cropped = image.crop(bbox)
-    gray = cropped.convert("L")
-    arr = np.array(gray)
-    black_ratio = (arr < 128).mean()  # fraction of dark pixels
-    return black_ratio > 0.15  # tune threshold
+    return ink_ratio(image, bbox) > BOLD_INK_RATIO
 
-def check_headers(line_text: str, line_bbox, current_image) -> bool:
+def check_headers(line_text: str, line_bbox, current_image, bold: bool = None) -> bool:
     """
     Detects if a given line of text is likely a section or subsection header.
+    `bold` is the line's precomputed `is_bold` result; when None it is
+    measured on `current_image`.
 
     Rules:
     - Starts with a number (e.g. '1.', '2.1', '3)')
@@ -56,20 +267,21 @@ def check_headers(line_text: str, line_bbox, current_image) -> bool:
 
     text = line_text.strip()
 
-    if is_bold(current_image, line_bbox) and  line_text[0].isupper():
+    if bold is None:
+        bold = is_bold(current_image, line_bbox)
+    if bold and line_text[0].isupper():
         return True
 
     # --- Numeric headers (e.g., "1.", "2.3", "3)") ---
-    if re.match(r'^\d+(\.\d+)*[\.\)]?\s', text):
+    if NUMERIC_HEADER_RE.match(text):
         return True
 
     # --- Roman numeral headers (e.g., "I.", "II)", "IV-") ---
-    if re.match(r'^(?=[MDCLXVI])M{0,4}(CM|CD|D?C{0,3})'
-                r'(XC|XL|L?X{0,3})(IX|IV|V?I{0,3})[\.\)\-]\s', text, re.IGNORECASE):
+    if ROMAN_HEADER_RE.match(text):
         return True
 
     # --- Alphabetic headers (e.g., "A.", "B)", "C-") ---
-    if re.match(r'^[A-Z][\.\)\-]\s', text):
+    if ALPHA_HEADER_RE.match(text):
         return True
 
     # --- Optional: short all-uppercase line (e.g., "ABSTRACT", "CONCLUSION") ---
@@ -79,77 +291,224 @@ def check_headers(line_text: str, line_bbox, current_image) -> bool:
     return False
 
 
+def is_header_line(line_text: str, line_bbox, page, bold: bool = None) -> bool:
+    """Line-level header flag, broadcast to every word of the line."""
+    return check_headers(line_text, line_bbox, page, bold=bold) and len(line_text) < 80
+
+
+
+def doctr_fingerprint(tables: str = "reuse", adaptive: bool = False) -> str:
+    """Backend / model / parameter fingerprint that keys cached docTR layouts."""
+    fingerprint = (f"doctr={package_version('python-doctr')}|pretrained|tables={tables}"
+                   f"|img2table={package_version('img2table') if tables != 'off' else '-'}")
+    if adaptive:
+        fingerprint += f"|adaptive-tables={TARGET_TEXT_HEIGHT},{MIN_SCALE},{MAX_SCALE}"
+    return fingerprint
+
 
-def ocr_doctr(image_path: str):
+def doctr_page_words(page) -> Dict:
+    """Words and lines of one docTR page, with docTR relative geometry."""
+    words, word_geoms, line_ids = [], [], []
+    lines, line_geoms = [], []
+    for block in page.blocks:
+        for line in block.lines:
+            line_id = len(lines)
+            lines.append(" ".join([word.value for word in line.words]))
+            line_geoms.append(line.geometry[0] + line.geometry[1])
+            for word in line.words:
+                words.append(word.value)
+                word_geoms.append(word.geometry[0] + word.geometry[1])
+                line_ids.append(line_id)
+
+    return {
+        "words": words,
+        "word_geoms": np.asarray(word_geoms, dtype=np.float64).reshape(-1, 4),
+        "line_ids": np.asarray(line_ids, dtype=np.int32),
+        "lines": lines,
+        "line_geoms": np.asarray(line_geoms, dtype=np.float64).reshape(-1, 4),
+    }
+
+
+def _doctr_page_layout(page, rgb_page: np.ndarray, tables: str = "reuse", scale: float = 1.0) -> Dict:
     """
-    Extract word-level tokens + bounding boxes + header + table flag using docTR and img2table.
+    Raw model output of one page: words and lines with docTR relative geometry,
+    plus img2table's table boxes in `rgb_page` pixels. This is what the OCR
+    cache stores. With scale < 1, tables are detected on a copy of the page
+    downscaled by `scale` and their boxes mapped back to the full page.
+    """
+    layout = doctr_page_words(page)
+
+    # --- Detect tables (img2table over the docTR words above) ---
+    with stage("tables", mode=tables, scale=round(scale, 3)):
+        small = downscale(rgb_page, scale)
+        if small is not rgb_page:
+            # img2table turns the relative word geometry into pixels with the page's dimensions (h, w)
+            page = SimpleNamespace(blocks=page.blocks, dimensions=small.shape[:2])
+        table_bboxes = detect_tables(small, doctr_page=page, mode=tables)
+        table_bboxes = rescale_pixels(table_bboxes, page_size(small), page_size(rgb_page))
+    layout["table_bboxes"] = table_bboxes
+    return layout
+
+
+def measure_page(layout: Dict, rgb_page: np.ndarray) -> Dict:
+    """
+    Add what the header rules need from the pixels to a layout: "image_size"
+    (w, h) and "line_ink", each line's `ink_ratio`. The measured layout is
+    the OCR stage's output (see src.main), so `page_from_layout` can re-run
+    the rules on it without the page image.
+    """
+    size = page_size(rgb_page)
+    line_bboxes = relative_to_pixels(layout["line_geoms"], size)
+    with stage("line_ink", lines=len(line_bboxes)):
+        # only the line crops are converted to grayscale
+        line_ink = [ink_ratio(rgb_page, line_bbox) for line_bbox in line_bboxes.tolist()]
+    layout["image_size"] = np.asarray(size, dtype=np.int32)
+    layout["line_ink"] = np.asarray(line_ink, dtype=np.float64)
+    return layout
+
+
+def page_from_layout(layout: Dict, rgb_page: np.ndarray = None) -> PageTokens:
     """
+    Apply the header and table rules to a docTR layout and build the PageTokens.
+    Cheap compared to OCR, so rule changes only re-run this on cached pages.
+    Layouts from `measure_page` need no `rgb_page`; otherwise it is measured here.
+    """
+    if "line_ink" not in layout:
+        layout = measure_page(dict(layout), rgb_page)
+    img_width, img_height = (int(v) for v in layout["image_size"])
+    lines = layout["lines"]
+
+    # --- docTR relative geometry -> pixel + 0-1000 boxes, one array op per page ---
+    bboxes, norm_bboxes = relative_to_layoutlm(layout["word_geoms"], (img_width, img_height))
+    line_bboxes = relative_to_pixels(layout["line_geoms"], (img_width, img_height))
+
+    # header is decided once per line, not once per word
+    with stage("headers", lines=len(lines)):
+        line_header = [
+            is_header_line(line_text, line_bbox, None, bold=ink > BOLD_INK_RATIO)
+            for line_text, line_bbox, ink in zip(lines, line_bboxes.tolist(), layout["line_ink"].tolist())
+        ]
+    count("words", len(layout["words"]))
+    count("header_lines", sum(line_header))
+    count("tables", len(layout["table_bboxes"]))
 
-    # --- Step 1: Load image properly using PIL ---
-    pil_img = PILImage.open(image_path).convert("RGB")
-    current_image = PILImage.open(image_path)
-    img_width, img_height = pil_img.size
-
-    # --- Step 2: Run Doctr ---
-    doc = DocumentFile.from_images(image_path)
-    result = model(doc)
-
-    all_words = []
-    for page in result.pages:
-        for block in page.blocks:
-            for line in block.lines:
-                size = int(line.geometry[1][1] * img_height) - int(line.geometry[0][1] * img_height)
-                line_bbox = [
-                    int(line.geometry[0][0] * img_width),
-                    int(line.geometry[0][1] * img_height),
-                    int(line.geometry[1][0] * img_width),
-                    int(line.geometry[1][1] * img_height),
-                ]
-                line_text = " ".join([word.value for word in line.words])
-
-                for word in line.words:
-                    x0 = int(word.geometry[0][0] * img_width)
-                    y0 = int(word.geometry[0][1] * img_height)
-                    x1 = int(word.geometry[1][0] * img_width)
-                    y1 = int(word.geometry[1][1] * img_height)
-                    all_words.append({
-                        "word": word.value,
-                        "bbox": [x0, y0, x1, y1],
-                        "height": size,
-                        "line_text": line_text,
-                        "line_bbox": line_bbox
-                    })
-
-    # --- Step 3: Detect tables (img2table) ---
-    img2table_img = Img2TableImage(str(image_path), detect_rotation=False)
-    img2table_ocr = Img2TableOCR()
-
-    extracted_tables = img2table_img.extract_tables(
-        ocr=img2table_ocr,
-        implicit_rows=False,
-        implicit_columns=False,
-        borderless_tables=True,
-        min_confidence=50
+    # --- Determine which table (if any) each word is inside ---
+    table_ids = assign_tables(bboxes, layout["table_bboxes"])
+
+    return PageTokens(
+        words=list(layout["words"]),
+        bboxes=bboxes,
+        line_ids=np.asarray(layout["line_ids"], dtype=np.int32),
+        lines=list(lines),
+        line_bboxes=line_bboxes,
+        line_header=np.asarray(line_header, dtype=bool),
+        table_ids=table_ids,
+        image_size=(img_width, img_height),
+        norm_bboxes=norm_bboxes,
     )
 
-    table_bboxes = [
-        [int(t.bbox.x1), int(t.bbox.y1), int(t.bbox.x2), int(t.bbox.y2)]
-        for t in extracted_tables if t.df.shape[0] > 2
-    ]
-
-    # --- Step 4: Determine if a word is inside a table ---
-    def in_table(bbox, table_bboxes):
-        x0, y0, x1, y1 = bbox
-        for tx0, ty0, tx1, ty1 in table_bboxes:
-            if x0 >= tx0 and y0 >= ty0 and x1 <= tx1 and y1 <= ty1:
-                return True
-        return False
 
-    for w in all_words:
-        w["inside_table"] = in_table(w["bbox"], table_bboxes)
-        w["header"] = True if check_headers(w["line_text"], w["line_bbox"], current_image) and len(w["line_text"]) < 80 else False
+def ocr_doctr_pages(images: Iterable, batch_size: int = DOCTR_BATCH_SIZE, tables: str = "reuse",
+                    adaptive: bool = False) -> List[PageTokens]:
+    """
+    Run docTR over many pages, feeding up to `batch_size` pages through a single
+    predictor call instead of one call per page.
+    `images` may hold image paths, PIL images or RGB arrays; each page is
+    decoded once and that array is shared by docTR, img2table and is_bold.
+    `tables` is one of TABLE_MODES ("reuse", "geometry", "off").
+    With `adaptive=True`, table detection runs on a copy of each page scaled
+    from its text height (see src.parsing.resolution) and its boxes are mapped
+    back to page pixels. docTR itself always gets the full page: its detector
+    resizes every page to its fixed input size anyway, and recognition crops
+    words from the page it was given.
+    Pages found in the OCR cache (see src.parsing.cache) skip docTR and img2table.
+    Returns one PageTokens per page.
+    """
+    return [page_from_layout(layout)
+            for layout in doctr_page_layouts(images, batch_size=batch_size, tables=tables, adaptive=adaptive)]
+
+
+def doctr_page_layouts(images: Iterable, batch_size: int = DOCTR_BATCH_SIZE, tables: str = "reuse",
+                       adaptive: bool = False) -> List[Dict]:
+    """The measured page layouts behind `ocr_doctr_pages` (see `measure_page`)."""
+    images = list(images)
+    cache = get_ocr_cache()
+    fingerprint = doctr_fingerprint(tables, adaptive=adaptive)
+    results = []
+    for start in range(0, len(images), batch_size):
+        rgb_pages = [load_page_image(img) for img in images[start:start + batch_size]]
+        keys, layouts = [None] * len(rgb_pages), [None] * len(rgb_pages)
+        if cache:
+            keys = [cache_key(rgb, fingerprint) for rgb in rgb_pages]
+            for i, key in enumerate(keys):
+                hit = cache.get(key)
+                if hit is not None:
+                    layouts[i] = unpack_arrays(hit)
+                    count("ocr_cache_hits")
+
+        missing = [i for i, layout in enumerate(layouts) if layout is None]
+        if missing:
+            scales = [1.0] * len(missing)
+            if adaptive and tables != "off":
+                scales = [detection_scale(rgb_pages[i]) for i in missing]
+                for scale in scales:
+                    gauge("detection_scale", round(scale, 3))
+            with stage("ocr_doctr", pages=len(missing)):
+                doc_result = get_model()([rgb_pages[i] for i in missing])
+            for i, page, scale in zip(missing, doc_result.pages, scales):
+                layouts[i] = _doctr_page_layout(page, rgb_pages[i], tables=tables, scale=scale)
+                if cache:
+                    cache.put(keys[i], pack_arrays(layouts[i]))
+
+        for rgb_page, layout in zip(rgb_pages, layouts):
+            results.append(measure_page(layout, rgb_page))
+    return results
+
+
+def page_from_word_layer(layer: Dict, rgb_page: np.ndarray, tables: str = "reuse",
+                         adaptive: bool = False) -> PageTokens:
+    """
+    PageTokens from words with boxes grouped into blocks and lines (a PDF text
+    layer, see src.parsing.text_layer, or Tesseract output): same layout,
+    table detection and header rules as docTR pages (`adaptive`: tables are
+    detected on a downscaled copy, as in `ocr_doctr_pages`).
+    """
+    return page_from_layout(word_layer_layout(layer, rgb_page, tables=tables, adaptive=adaptive))
+
+
+def word_layer_layout(layer: Dict, rgb_page: np.ndarray, tables: str = "reuse", adaptive: bool = False) -> Dict:
+    """The measured page layout behind `page_from_word_layer` (see `measure_page`)."""
+    doctr_page = to_doctr_page(layer, page_size(rgb_page))
+    scale = detection_scale(rgb_page) if adaptive and tables != "off" else 1.0
+    layout = _doctr_page_layout(doctr_page, rgb_page, tables=tables, scale=scale)
+    return measure_page(layout, rgb_page)
+
 
-    return all_words
+def ocr_doctr_batch(images: Iterable, batch_size: int = DOCTR_BATCH_SIZE, tables: str = "reuse") -> List[List[Dict]]:
+    """
+    Same as `ocr_doctr_pages`, but returns one word-dict list per page,
+    in the same format as `ocr_doctr`.
+    """
+    return [page.to_dicts() for page in ocr_doctr_pages(images, batch_size=batch_size, tables=tables)]
+
+
+def ocr_doctr(image_path: PageImage, tables: str = "reuse"):
+    """
+    Extract word-level tokens + bounding boxes + header + table flag using docTR and img2table.
+    img2table reuses the docTR words instead of running its own OCR (see TABLE_MODES).
+    """
+    return ocr_doctr_batch([image_path], batch_size=1, tables=tables)[0]
+
+
+def normalize_page(page: PageTokens) -> PageTokens:
+    """
+    Fill `page.norm_bboxes` with LayoutLMv3 0-1000 boxes (int16), with the
+    same truncation and clipping as `normalize_bboxes`.
+    docTR pages already carry them from `relative_to_layoutlm`.
+    """
+    if page.norm_bboxes is None:
+        page.norm_bboxes = pixels_to_layoutlm(page.bboxes, page.image_size)
+    return page
 
 
 def normalize_bboxes(tokens: List[Dict], image_size: Tuple[int, int]) -> List[Dict]:
@@ -157,16 +516,10 @@ def normalize_bboxes(tokens: List[Dict], image_size: Tuple[int, int]) -> List[Di
     Convert absolute pixel bboxes to LayoutLMv3 expected 0-1000 normalized bboxes.
     Each bbox becomes [x0, y0, x1, y1] in 0-1000.
     """
-    w, h = image_size
+    norm = pixels_to_layoutlm([t['bbox'] for t in tokens], image_size).tolist()
     norm_tokens = []
-    for t in tokens:
-        x0, y0, x1, y1 = t['bbox']
-        nx0 = int((x0 / w) * 1000)
-        ny0 = int((y0 / h) * 1000)
-        nx1 = int((x1 / w) * 1000)
-        ny1 = int((y1 / h) * 1000)
-        # clip
-        nx0, ny0, nx1, ny1 = max(0, nx0), max(0, ny0), min(1000, nx1), min(1000, ny1)
-        nt = {'word': t['word'], 'bbox': [nx0, ny0, nx1, ny1], 'orig_bbox': t['bbox'], "header": t["header"], "inside_table": t["inside_table"], "line_text": t["line_text"]}
+    for t, bbox in zip(tokens, norm):
+        nt = {'word': t['word'], 'bbox': bbox, 'orig_bbox': t['bbox'], "header": t["header"], "inside_table": t["inside_table"], "line_text": t["line_text"],
+              "table_id": t.get("table_id")}
         norm_tokens.append(nt)
-    return norm_tokens
\ No newline at end of file
+    return norm_tokens
@@ -0,0 +1,25 @@
+from pathlib import Path
+from typing import Union
+import numpy as np
+from PIL import Image
+
+# A page can be handed around as a path (decoded here), a PIL image or an
+# RGB uint8 array; every stage works on the array decoded once by load_page_image.
+PageImage = Union[str, Path, Image.Image, np.ndarray]
+
+
+def load_page_image(image: PageImage) -> np.ndarray:
+    """Return the page as an (H, W, 3) RGB uint8 array, decoding from disk only for paths."""
+    if isinstance(image, np.ndarray):
+        if image.ndim == 2:
+            return np.stack([image] * 3, axis=-1)
+        return image[..., :3]
+    if isinstance(image, Image.Image):
+        return np.asarray(image.convert("RGB"))
+    with Image.open(image) as img:
+        return np.asarray(img.convert("RGB"))
+
+
+def page_size(image: np.ndarray):
+    """(w, h) of a page array, the PIL `.size` order used across the pipeline."""
+    return image.shape[1], image.shape[0]
@@ -0,0 +1,66 @@
+from dataclasses import dataclass
+from typing import List, Dict, Optional, Tuple
+import numpy as np
+
+
+@dataclass(slots=True)
+class PageTokens:
+    """
+    Columnar OCR output of one page.
+    Per-word data lives in parallel arrays; line text, line boxes and the
+    header flag are stored once per line and referenced through `line_ids`.
+    """
+    words: List[str]
+    bboxes: np.ndarray                      # (N, 4) int32 pixel boxes
+    line_ids: np.ndarray                    # (N,) int32 index into the line table
+    lines: List[str]                        # (L,) line text
+    line_bboxes: np.ndarray                 # (L, 4) int32 pixel boxes
+    line_header: np.ndarray                 # (L,) bool
+    table_ids: np.ndarray                   # (N,) int32, -1 outside tables
+    image_size: Tuple[int, int]             # (w, h) in pixels
+    norm_bboxes: Optional[np.ndarray] = None  # (N, 4) int16 in 0-1000, see normalize_page
+    labels: Optional[np.ndarray] = None       # (N,) int64, see synthetic_labeling
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    @property
+    def header(self) -> np.ndarray:
+        return self.line_header[self.line_ids]
+
+    @property
+    def inside_table(self) -> np.ndarray:
+        return self.table_ids >= 0
+
+    @classmethod
+    def empty(cls, image_size: Tuple[int, int]) -> "PageTokens":
+        return cls(
+            words=[],
+            bboxes=np.zeros((0, 4), dtype=np.int32),
+            line_ids=np.zeros(0, dtype=np.int32),
+            lines=[],
+            line_bboxes=np.zeros((0, 4), dtype=np.int32),
+            line_header=np.zeros(0, dtype=bool),
+            table_ids=np.zeros(0, dtype=np.int32),
+            image_size=image_size,
+        )
+
+    def to_dicts(self) -> List[Dict]:
+        """Expand back to the per-word dict format of `ocr_doctr`."""
+        line_bboxes = self.line_bboxes.tolist()
+        heights = (self.line_bboxes[:, 3] - self.line_bboxes[:, 1]).tolist()
+        line_header = self.line_header.tolist()
+        tokens = []
+        for word, bbox, line_id, table_id in zip(self.words, self.bboxes.tolist(),
+                                                  self.line_ids.tolist(), self.table_ids.tolist()):
+            tokens.append({
+                "word": word,
+                "bbox": bbox,
+                "height": heights[line_id],
+                "line_text": self.lines[line_id],
+                "line_bbox": line_bboxes[line_id],
+                "header": line_header[line_id],
+                "inside_table": table_id >= 0,
+                "table_id": table_id
+            })
+        return tokens
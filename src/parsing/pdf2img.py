@@ -1,29 +1,141 @@
-from pdf2image import convert_from_path
+import contextvars
+import json
+from pdf2image import convert_from_path, pdfinfo_from_path
 from pathlib import Path
-from typing import List
+from queue import Full, Queue
+from threading import Event, Thread
+from typing import List, Iterator, Iterable, Optional, Tuple
+from PIL import Image
+from src.instrumentation import stage, count, gauge
+from src.dataset.manifest import file_digest
 
-def pdf_to_images(pdf_path: str, IMAGES_DIR: str, dpi: int = 200, 
-                  poppler_path: str = r"C:\Users\pavit\Downloads\Release-25.07.0-0\poppler-25.07.0\Library\bin") -> List[Path]:
-    """Convert each page of a PDF to an image and return list of saved image paths."""
-    
-    # Ensure output directory exists
+_DONE = object()
+
+def prefetch(items: Iterable, depth: int = 2) -> Iterator:
+    """
+    Run `items` in a background thread, keeping up to `depth` results ready.
+    poppler runs as a subprocess, so later pages rasterize while the consumer
+    is still OCR-ing earlier ones. If the consumer stops early (an exception,
+    a closed generator), the thread stops at its next item and drops the
+    pages it holds instead of blocking on the full queue forever.
+    """
+    queue = Queue(maxsize=depth)
+    stopped = Event()
+
+    def put(item) -> bool:
+        while not stopped.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                pass
+        return False
+
+    def worker():
+        try:
+            for item in items:
+                if not put(item):
+                    return
+        except BaseException as err:  # re-raised in the consumer
+            put(err)
+            return
+        put(_DONE)
+
+    # the thread runs in a copy of the caller's context, so its events keep the document fields
+    Thread(target=contextvars.copy_context().run, args=(worker,), daemon=True).start()
+    try:
+        while True:
+            gauge("prefetch_queue", queue.qsize())
+            item = queue.get()
+            if item is _DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stopped.set()
+
+def pdf_page_count(pdf_path: str, poppler_path: Optional[str] = None) -> int:
+    """Number of pages in the PDF, read from poppler's pdfinfo."""
+    return int(pdfinfo_from_path(pdf_path, poppler_path=poppler_path)["Pages"])
+
+def pdf_page_range(pdf_path: str, first_page: int, last_page: int, dpi: int = 200,
+                   poppler_path: Optional[str] = None, thread_count: int = 1) -> List[Image.Image]:
+    """Rasterize pages first_page..last_page (1-based, inclusive) only."""
+    with stage("pdf_to_images", first_page=first_page, last_page=last_page, dpi=dpi):
+        images = convert_from_path(
+            pdf_path=pdf_path,
+            dpi=dpi,
+            first_page=first_page,
+            last_page=last_page,
+            thread_count=thread_count,
+            poppler_path=poppler_path
+        )
+    count("pages", len(images))
+    return images
+
+def iter_pdf_images(pdf_path: str, dpi: int = 200, poppler_path: Optional[str] = None,
+                    pages_per_batch: int = 4, thread_count: int = 1) -> Iterator[Tuple[int, Image.Image]]:
+    """
+    Lazily rasterize a PDF, `pages_per_batch` pages per poppler call.
+    Yields (page_index, PIL image) as soon as each range is converted, so
+    only one range of pages is held in memory at a time.
+    `poppler_path` is only needed when poppler is not on PATH.
+    """
+    n_pages = pdf_page_count(pdf_path, poppler_path=poppler_path)
+    for first in range(1, n_pages + 1, pages_per_batch):
+        last = min(first + pages_per_batch - 1, n_pages)
+        images = pdf_page_range(pdf_path, first, last, dpi=dpi, poppler_path=poppler_path,
+                                thread_count=thread_count)
+        for offset, img in enumerate(images):
+            yield first - 1 + offset, img
+
+def _render_stamp(output_dir: Path, base: str) -> Path:
+    """Sidecar recording which PDF content and DPI the PNGs of `base` were rendered from."""
+    return output_dir / f".{base}.render.json"
+
+def iter_pdf_to_images(pdf_path: str, IMAGES_DIR: str, dpi: int = 200, poppler_path: Optional[str] = None,
+                       pages_per_batch: int = 4, thread_count: int = 1, overwrite: bool = False) -> Iterator[Path]:
+    """
+    Streaming `pdf_to_images`: saves each page as it is rasterized and yields its path.
+    Page ranges whose PNGs all exist already are not rasterized again if a
+    sidecar stamp shows they were rendered from the same PDF content at the
+    same `dpi`; `overwrite=True` always renders. The stamp is written once
+    every page has been saved, so an interrupted run never vouches for
+    PNGs it did not finish.
+    """
     output_dir = Path(IMAGES_DIR)
     output_dir.mkdir(parents=True, exist_ok=True)
-    
-    # Convert PDF to list of PIL images
-    images = convert_from_path(
-        pdf_path=pdf_path,
-        dpi=dpi,
-        poppler_path=poppler_path
-    )
-
-    saved_paths = []
     base = Path(pdf_path).stem
+    stamp_path = _render_stamp(output_dir, base)
+    stamp = {"input_hash": file_digest(pdf_path), "dpi": dpi}
+    try:
+        reuse = not overwrite and json.loads(stamp_path.read_text()) == stamp
+    except (OSError, ValueError):
+        reuse = False
+    if not reuse:
+        stamp_path.unlink(missing_ok=True)
+
+    n_pages = pdf_page_count(pdf_path, poppler_path=poppler_path)
+    for first in range(1, n_pages + 1, pages_per_batch):
+        last = min(first + pages_per_batch - 1, n_pages)
+        out_paths = [output_dir / f"{base}_page_{i:03d}.png" for i in range(first - 1, last)]
+        if reuse and all(p.exists() for p in out_paths):
+            yield from out_paths
+            continue
+        images = pdf_page_range(pdf_path, first, last, dpi=dpi, poppler_path=poppler_path,
+                                thread_count=thread_count)
+        for out_path, img in zip(out_paths, images):
+            img.save(out_path)
+            img.close()
+            yield out_path
+    stamp_path.write_text(json.dumps(stamp))
 
-    # Save each image page
-    for i, img in enumerate(images):
-        out_path = output_dir / f"{base}_page_{i:03d}.png"
-        img.save(out_path)
-        saved_paths.append(out_path)
-    
-    return saved_paths
+def pdf_to_images(pdf_path: str, IMAGES_DIR: str, dpi: int = 200,
+                  poppler_path: Optional[str] = None, overwrite: bool = False) -> List[Path]:
+    """
+    Convert each page of a PDF to an image and return list of saved image paths.
+    PNGs already in IMAGES_DIR are reused only if they were rendered from the
+    same PDF content and `dpi` (see `iter_pdf_to_images`), or never with `overwrite=True`.
+    """
+    return list(iter_pdf_to_images(pdf_path, IMAGES_DIR, dpi=dpi, poppler_path=poppler_path, overwrite=overwrite))
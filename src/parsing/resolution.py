@@ -0,0 +1,52 @@
+from typing import Optional
+import numpy as np
+from PIL import Image
+
+# Adaptive resolution: pages are rasterized once at the build DPI, but table
+# detection (img2table works on the full pixel grid) runs on a copy scaled so
+# that text is about TARGET_TEXT_HEIGHT pixels tall. docTR is always given the
+# full page (its detector resizes to a fixed input size, and recognition crops
+# from the page it gets), the bold checks read full-resolution crops, and table
+# boxes are mapped back to the full page, so outputs keep their coordinates.
+
+TARGET_TEXT_HEIGHT = 12  # px of a text line on the detection copy
+MIN_SCALE = 0.25         # never go below a quarter of the build DPI
+MAX_SCALE = 0.9          # closer to 1 than this the copy is not worth making
+MIN_LINES = 3            # fewer text lines than this: keep the page as it is
+
+
+def estimate_text_height(rgb_page: np.ndarray) -> Optional[float]:
+    """
+    Typical height in pixels of the page's text lines (lower quartile, so
+    headings and merged columns do not inflate it), from the runs of rows that
+    contain ink. None when the page has too little text to tell.
+    """
+    channel = rgb_page if rgb_page.ndim == 2 else rgb_page[..., 1]
+    ink_rows = (channel[:, ::4] < 128).sum(axis=1) >= 2  # every 4th column is plenty for a row profile
+    edges = np.diff(np.concatenate([[0], ink_rows.astype(np.int8), [0]]))
+    heights = np.flatnonzero(edges == -1) - np.flatnonzero(edges == 1)
+    heights = heights[heights >= 3]  # rules, specks
+    if len(heights) < MIN_LINES:
+        return None
+    return float(np.percentile(heights, 25))
+
+
+def detection_scale(rgb_page: np.ndarray) -> float:
+    """
+    Scale factor for the page's detection copy, i.e. its detection DPI is
+    build DPI * scale; 1.0 keeps the page as it is.
+    """
+    height = estimate_text_height(rgb_page)
+    if height is None:
+        return 1.0
+    scale = max(TARGET_TEXT_HEIGHT / height, MIN_SCALE)
+    return scale if scale <= MAX_SCALE else 1.0
+
+
+def downscale(rgb_page: np.ndarray, scale: float) -> np.ndarray:
+    """The page resized by `scale` (the page itself for scale >= 1)."""
+    if scale >= 1.0:
+        return rgb_page
+    h, w = rgb_page.shape[:2]
+    size = (max(1, round(w * scale)), max(1, round(h * scale)))
+    return np.asarray(Image.fromarray(rgb_page).resize(size, Image.Resampling.BILINEAR, reducing_gap=2.0))
@@ -0,0 +1,68 @@
+from typing import List
+import numpy as np
+
+# "reuse"    -> img2table reads the words docTR already produced for the page
+# "geometry" -> line/border detection only, no OCR: cells carry no text, but tables are
+#               still kept only with more than 2 rows, as in "reuse"
+# "off"      -> skip table detection, e.g. for documents known to have no tables
+TABLE_MODES = ("reuse", "geometry", "off")
+
+
+def detect_tables(image_src, doctr_page=None, mode: str = "reuse") -> List[List[int]]:
+    """
+    Detect tables with img2table and return their pixel bboxes [x0, y0, x1, y1].
+    `image_src` is an RGB page array, or a path / encoded bytes.
+    Only tables with more than 2 rows are kept, in every mode (`t.content`
+    holds one entry per row, with or without cell text).
+    """
+    if mode not in TABLE_MODES:
+        raise ValueError(f"Unknown table mode {mode!r}, expected one of {TABLE_MODES}")
+    if mode == "off":
+        return []
+
+    # img2table (and its cv2/polars stack) is only imported once tables are detected
+    from img2table.document import Image as Img2TableImage
+    from src.parsing.img2table_adapters import ArrayImage, CachedDocTROCR
+
+    ocr = CachedDocTROCR(doctr_page) if mode == "reuse" and doctr_page is not None else None
+
+    if isinstance(image_src, np.ndarray):
+        img2table_img = ArrayImage(b"", detect_rotation=False, array=image_src)
+    else:
+        src = image_src if isinstance(image_src, bytes) else str(image_src)
+        img2table_img = Img2TableImage(src, detect_rotation=False)
+    extracted_tables = img2table_img.extract_tables(
+        ocr=ocr,
+        implicit_rows=False,
+        implicit_columns=False,
+        borderless_tables=True,
+        min_confidence=50
+    )
+
+    return [
+        [int(t.bbox.x1), int(t.bbox.y1), int(t.bbox.x2), int(t.bbox.y2)]
+        for t in extracted_tables if len(t.content) > 2
+    ]
+
+
+def assign_tables(word_bboxes, table_bboxes, block_size: int = 4096) -> np.ndarray:
+    """
+    Index of the table fully containing each word box, -1 when the word is
+    in no table (first table wins on overlap).
+    Containment is one NumPy broadcast over (words x tables), done in blocks
+    of `block_size` words so pages with many tables keep memory bounded.
+    """
+    words = np.asarray(word_bboxes, dtype=np.int64).reshape(-1, 4)
+    tables = np.asarray(table_bboxes, dtype=np.int64).reshape(-1, 4)
+    table_ids = np.full(len(words), -1, dtype=np.int32)
+    if len(words) == 0 or len(tables) == 0:
+        return table_ids
+
+    for start in range(0, len(words), block_size):
+        w = words[start:start + block_size, None, :]
+        inside = (
+            (w[..., 0] >= tables[:, 0]) & (w[..., 1] >= tables[:, 1])
+            & (w[..., 2] <= tables[:, 2]) & (w[..., 3] <= tables[:, 3])
+        )
+        table_ids[start:start + block_size] = np.where(inside.any(axis=1), inside.argmax(axis=1), -1)
+    return table_ids
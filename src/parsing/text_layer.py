@@ -0,0 +1,162 @@
+import os
+import subprocess
+import xml.etree.ElementTree as ET
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from src.instrumentation import emit
+
+# Native text layer of born-digital PDFs, read with poppler's `pdftotext -bbox-layout`
+# (poppler is already required by pdf2image). Pages are turned into docTR-shaped
+# objects (blocks -> lines -> words with relative geometry), so the docTR path's
+# layout, table detection and header rules run on them unchanged, without OCR.
+
+_XHTML = "{http://www.w3.org/1999/xhtml}"
+
+# a page is taken from its text layer only with at least MIN_WORDS words, of which
+# at most MAX_UNMAPPED_RATIO have glyphs without a Unicode mapping (broken fonts),
+# and only if those words account for the page's text: at least MIN_INK_COVERAGE of
+# the rendered page's ink lies inside word boxes (or, without a rendered page, the
+# boxes cover MIN_AREA_COVERAGE of it). A scan with a stamped footer or Bates number
+# has a few real words but nearly all of its ink outside them.
+MIN_WORDS = 5
+MAX_UNMAPPED_RATIO = 0.1
+MIN_INK_COVERAGE = 0.5
+MIN_AREA_COVERAGE = 0.01
+INK_LEVEL = 128   # pixels darker than this (in every channel) count as ink
+BOX_PADDING = 2   # px around word boxes for antialiased glyph edges
+
+
+def text_layer_fingerprint() -> str:
+    """Detector thresholds that decide which pages come from the text layer."""
+    return f"text_layer={MIN_WORDS},{MAX_UNMAPPED_RATIO},{MIN_INK_COVERAGE},{MIN_AREA_COVERAGE},{INK_LEVEL}"
+
+
+def _pdftotext(poppler_path: Optional[str]) -> str:
+    return os.path.join(poppler_path, "pdftotext") if poppler_path else "pdftotext"
+
+
+def read_text_layer(pdf_path: str, first_page: int, last_page: int,
+                    poppler_path: Optional[str] = None) -> Dict[int, Dict]:
+    """
+    Words, lines and blocks of pages first_page..last_page (1-based, inclusive).
+    Returns {page_index (0-based): page}, see `parse_bbox_layout`. When the
+    layer cannot be read (no pdftotext, a damaged PDF, malformed output) a
+    "text_layer_error" event is emitted and {} is returned, so the pages are OCR'd.
+    """
+    try:
+        result = subprocess.run(
+            [_pdftotext(poppler_path), "-bbox-layout", "-enc", "UTF-8",
+             "-f", str(first_page), "-l", str(last_page), str(pdf_path), "-"],
+            check=True, capture_output=True,
+        )
+        pages = parse_bbox_layout(result.stdout)
+    except (FileNotFoundError, subprocess.CalledProcessError, ET.ParseError) as err:
+        emit("text_layer_error", first_page=first_page, last_page=last_page, error=type(err).__name__,
+             message=str(err)[:200])
+        return {}
+    return {first_page - 1 + i: page for i, page in enumerate(pages)}
+
+
+def _box(el) -> Tuple[float, float, float, float]:
+    return (float(el.get("xMin")), float(el.get("yMin")), float(el.get("xMax")), float(el.get("yMax")))
+
+
+def parse_bbox_layout(xhtml: bytes) -> List[Dict]:
+    """
+    Parse `pdftotext -bbox-layout` output into one dict per page:
+    {"width", "height" (PDF points), "blocks": [[[(word, (x0, y0, x1, y1)), ...] per line] per block]}.
+    """
+    root = ET.fromstring(xhtml)
+    pages = []
+    for page_el in root.iter(f"{_XHTML}page"):
+        blocks = []
+        for block_el in page_el.iter(f"{_XHTML}block"):
+            lines = []
+            for line_el in block_el.iter(f"{_XHTML}line"):
+                words = [(w.text or "", _box(w)) for w in line_el.iter(f"{_XHTML}word") if (w.text or "").strip()]
+                if words:
+                    lines.append(words)
+            if lines:
+                blocks.append(lines)
+        pages.append({"width": float(page_el.get("width")), "height": float(page_el.get("height")),
+                      "blocks": blocks})
+    return pages
+
+
+def _word_boxes(page: Dict) -> np.ndarray:
+    return np.asarray([box for lines in page["blocks"] for line in lines for _, box in line],
+                      dtype=np.float64).reshape(-1, 4)
+
+
+def ink_coverage(page: Dict, rgb_page: np.ndarray) -> float:
+    """Fraction of the rendered page's ink pixels that lie inside the text layer's word boxes."""
+    if rgb_page.ndim == 3:  # per-channel compares; much cheaper than min(axis=-1) on a full page
+        ink = (rgb_page[..., 0] < INK_LEVEL) & (rgb_page[..., 1] < INK_LEVEL) & (rgb_page[..., 2] < INK_LEVEL)
+    else:
+        ink = rgb_page < INK_LEVEL
+    total = int(ink.sum())
+    if not total:
+        return 1.0
+    height, width = ink.shape
+    sx, sy = width / page["width"], height / page["height"]
+    boxes = _word_boxes(page) * [sx, sy, sx, sy]
+    boxes = np.clip(np.round(boxes).astype(np.int64) + [-BOX_PADDING, -BOX_PADDING, BOX_PADDING, BOX_PADDING],
+                    0, [width, height, width, height])
+    covered = np.zeros_like(ink)
+    for x0, y0, x1, y1 in boxes.tolist():
+        covered[y0:y1, x0:x1] = True
+    return int((ink & covered).sum()) / total
+
+
+def area_coverage(page: Dict) -> float:
+    """Fraction of the page area covered by word boxes (overlaps counted twice)."""
+    boxes = _word_boxes(page)
+    area = ((boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])).sum()
+    return float(area) / (page["width"] * page["height"])
+
+
+def has_text_layer(page: Dict, rgb_page: Optional[np.ndarray] = None) -> bool:
+    """
+    Per-page detector: True when the page carries usable text, False for
+    scanned or image-only pages (and pages with unmapped fonts), which need OCR.
+    With the rendered page (`rgb_page`), most of its ink must lie inside the
+    word boxes, so scans with a small text overlay (stamp, Bates number) are
+    OCR'd; without it, the word boxes must cover a minimum share of the page.
+    """
+    words = [word for lines in page["blocks"] for line in lines for word, _ in line]
+    if len(words) < MIN_WORDS:
+        return False
+    unmapped = sum("�" in word for word in words)
+    if unmapped > MAX_UNMAPPED_RATIO * len(words):
+        return False
+    if rgb_page is not None:
+        return ink_coverage(page, rgb_page) >= MIN_INK_COVERAGE
+    return area_coverage(page) >= MIN_AREA_COVERAGE
+
+
+def to_doctr_page(page: Dict, image_size: Tuple[int, int]) -> SimpleNamespace:
+    """
+    docTR-shaped page (blocks -> lines -> words with relative geometry, value,
+    confidence; `dimensions` as (h, w) of the rendered page) for one text-layer page.
+    """
+    w_pt, h_pt = page["width"], page["height"]
+
+    def rel(box):
+        x0, y0, x1, y1 = box
+        return ((x0 / w_pt, y0 / h_pt), (x1 / w_pt, y1 / h_pt))
+
+    blocks = []
+    for lines in page["blocks"]:
+        doctr_lines = []
+        for line in lines:
+            words = [SimpleNamespace(value=word, geometry=rel(box), confidence=1.0) for word, box in line]
+            x0 = min(box[0] for _, box in line)
+            y0 = min(box[1] for _, box in line)
+            x1 = max(box[2] for _, box in line)
+            y1 = max(box[3] for _, box in line)
+            doctr_lines.append(SimpleNamespace(words=words, geometry=rel((x0, y0, x1, y1))))
+        blocks.append(SimpleNamespace(lines=doctr_lines))
+
+    width, height = image_size
+    return SimpleNamespace(blocks=blocks, dimensions=(height, width))
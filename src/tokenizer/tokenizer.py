@@ -1,13 +1,40 @@
 # ------------- tokenization + alignment --------------
-from typing import List
-from transformers import LayoutLMv3Processor
+import itertools
+import threading
+from dataclasses import dataclass
+from typing import List, Dict
+import numpy as np
+from src.instrumentation import stage, count
 
 MAX_LEN = 512
 OVERLAP = 128
 STRIDE = MAX_LEN - OVERLAP
 MODEL_NAME = "microsoft/layoutlmv3-base"  # used only for tokenizer/processor
 
-processor = LayoutLMv3Processor.from_pretrained(MODEL_NAME)
+# chunking strategies: fixed sliding windows, or windows cut at line / word boundaries
+CHUNKING = ("sliding", "lines")
+
+# LayoutLMv3 processor, built on first use by get_processor() (transformers is imported there)
+_processor = None
+_processor_lock = threading.Lock()
+
+
+def get_processor():
+    """Return the process-wide LayoutLMv3 processor, loading it once (thread-safe)."""
+    global _processor
+    if _processor is None:
+        with _processor_lock:
+            if _processor is None:
+                from transformers import LayoutLMv3Processor
+                _processor = LayoutLMv3Processor.from_pretrained(MODEL_NAME)
+    return _processor
+
+
+def __getattr__(name):
+    # keeps `from src.tokenizer.tokenizer import processor` working without loading at import time
+    if name == "processor":
+        return get_processor()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 def tokenize_and_align_labels(words: List[str], bboxes: List[List[int]], word_labels: List[int]):
     """
@@ -18,52 +45,348 @@ def tokenize_and_align_labels(words: List[str], bboxes: List[List[int]], word_la
       aligned_labels (list of int per token),
       token_bboxes (list of bbox per token aligned to word)
     """
-    tokenizer = processor.tokenizer
+    tokenizer = get_processor().tokenizer
     encoding = tokenizer(words,
                          boxes=bboxes, # Added boxes argument
                          return_attention_mask=True,
                          truncation=False)  # we will chunk later
 
     word_ids = encoding.word_ids()  # list of word index per token
-    aligned_labels = []
-    token_bboxes = []
-    for idx in word_ids:
-        if idx is None:
-            # special tokens like [CLS], [SEP]
-            aligned_labels.append(-100)  # -100 will be ignored by loss functions
-            token_bboxes.append([0,0,0,0])
-        else:
-            aligned_labels.append(word_labels[idx])
-            token_bboxes.append(bboxes[idx])
-    return encoding, aligned_labels, token_bboxes
+    aligned_labels, token_bboxes, _ = align_to_tokens(word_ids, word_labels, bboxes)
+    return encoding, aligned_labels.tolist(), token_bboxes.tolist()
+
+
+def align_to_tokens(word_ids, word_labels, bboxes, words=None):
+    """
+    Gather word-level labels / bboxes (and optionally words) onto tokens, using
+    word_ids as the index. Special tokens ([CLS], [SEP], ...) get label -100,
+    bbox [0,0,0,0] and word "[SPECIAL]".
+    Returns (labels int64 (T,), bboxes int64 (T,4), token_words list or None).
+    """
+    ids = np.array([-1 if idx is None else idx for idx in word_ids], dtype=np.int64)
+    special = ids < 0
+    gather = np.where(special, 0, ids)
+
+    word_labels = np.asarray(word_labels, dtype=np.int64)
+    bboxes = np.asarray(bboxes, dtype=np.int64).reshape(-1, 4)
+    if len(word_labels) == 0:
+        # only special tokens; gather from a dummy word that is masked out below
+        word_labels = np.zeros(1, dtype=np.int64)
+        bboxes = np.zeros((1, 4), dtype=np.int64)
+        words = [""] if words is not None else None
+
+    aligned_labels = word_labels[gather]
+    aligned_labels[special] = -100  # -100 will be ignored by loss functions
+    token_bboxes = bboxes[gather]
+    token_bboxes[special] = 0
+
+    token_words = None
+    if words is not None:
+        token_words = np.asarray(words, dtype=object)[gather]
+        token_words[special] = "[SPECIAL]"
+        token_words = token_words.tolist()
+    return aligned_labels, token_bboxes, token_words
+
+
+def tokenize_and_align_batch(batch_words: List[List[str]], batch_bboxes: List[List[List[int]]],
+                             batch_labels: List[List[int]]) -> List[Dict]:
+    """
+    Tokenize many pages in one call so the Rust fast tokenizer can parallelize
+    across them, then align labels / bboxes / words per page with array gathers.
+    Returns one dict per page with input_ids, attention_mask, labels, bboxes,
+    word_ids (NumPy arrays, word_ids -1 for special tokens) and token_words
+    (list, "[SPECIAL]" for special tokens).
+    """
+    if not batch_words:
+        return []
+    tokenizer = get_processor().tokenizer
+    with stage("tokenize", pages=len(batch_words)):
+        encoding = tokenizer(batch_words,
+                             boxes=batch_bboxes,
+                             return_attention_mask=True,
+                             truncation=False)  # we will chunk later
+    count("tokens", sum(len(ids) for ids in encoding["input_ids"]))
+
+    pages = []
+    for i, (words, bboxes, word_labels) in enumerate(zip(batch_words, batch_bboxes, batch_labels)):
+        word_ids = encoding.word_ids(batch_index=i)
+        aligned_labels, token_bboxes, token_words = align_to_tokens(word_ids, word_labels, bboxes, words=words)
+        pages.append({
+            "input_ids": np.asarray(encoding["input_ids"][i], dtype=np.int64),
+            "attention_mask": np.asarray(encoding["attention_mask"][i], dtype=np.int64),
+            "labels": aligned_labels,
+            "bboxes": token_bboxes,
+            "word_ids": np.array([-1 if idx is None else idx for idx in word_ids], dtype=np.int64),
+            "token_words": token_words,
+        })
+    return pages
 
 # ------------- chunking -------------
+def sliding_window_offsets(n: int, max_len=MAX_LEN, stride=STRIDE) -> np.ndarray:
+    """
+    (start, end) token offsets of the sliding windows over n tokens, shape (K, 2).
+    Same windows as `sliding_window_chunks`; requires 0 < stride <= max_len.
+    """
+    if not 0 < stride <= max_len:
+        raise ValueError(f"stride must be in (0, max_len={max_len}], got {stride}")
+    if n <= 0:
+        return np.zeros((0, 2), dtype=np.int64)
+    # last window is the first one that reaches the end
+    num = 1 if n <= max_len else -(-(n - max_len) // stride) + 1
+    starts = np.arange(num, dtype=np.int64) * stride
+    ends = np.minimum(starts + max_len, n)
+    return np.stack([starts, ends], axis=1)
+
+
+def _last_in(positions: np.ndarray, lo: int, hi: int):
+    """Largest of the sorted `positions` in (lo, hi], or None."""
+    i = np.searchsorted(positions, hi, side="right") - 1
+    return int(positions[i]) if i >= 0 and positions[i] > lo else None
+
+
+def _first_in(positions: np.ndarray, lo: int, hi: int):
+    """Smallest of the sorted `positions` in [lo, hi), or None."""
+    i = np.searchsorted(positions, lo, side="left")
+    return int(positions[i]) if i < len(positions) and positions[i] < hi else None
+
+
+def line_window_offsets(word_ids, line_ids=None, max_len=MAX_LEN, overlap=OVERLAP) -> np.ndarray:
+    """
+    (start, end) token offsets, shape (K, 2), of windows that end at a line
+    start, else at a word start, as long as that keeps them over half full
+    (only words longer than half a window get split). `word_ids` has each token's word index (-1 / None for special
+    tokens), `line_ids` each word's line (None: word boundaries only).
+    The overlap adapts to the text: the next window starts at the first whole
+    line (else word) within `overlap` tokens before the cut, and without such
+    a boundary the windows do not overlap.
+    """
+    ids = np.array([-1 if idx is None else idx for idx in word_ids], dtype=np.int64)
+    n = len(ids)
+    if n <= 0:
+        return np.zeros((0, 2), dtype=np.int64)
+    special = ids < 0
+    new_word = np.ones(n, dtype=bool)
+    new_word[1:] = (ids[1:] != ids[:-1]) | special[1:]
+    new_line = new_word.copy()
+    if line_ids is not None and len(line_ids):
+        token_lines = np.where(special, -1, np.asarray(line_ids, dtype=np.int64)[np.where(special, 0, ids)])
+        new_line[1:] &= (token_lines[1:] != token_lines[:-1]) | special[1:]
+    word_starts, line_starts = np.flatnonzero(new_word), np.flatnonzero(new_line)
+
+    offsets, start = [], 0
+    while True:
+        end = min(start + max_len, n)
+        if end == n:
+            offsets.append((start, n))
+            break
+        cut = _last_in(line_starts, start + max_len // 2, end)
+        if cut is None:
+            cut = _last_in(word_starts, start + max_len // 2, end)
+        if cut is None:  # one word longer than the window
+            cut = end
+        offsets.append((start, cut))
+        lo = max(cut - overlap, start + 1)
+        next_start = _first_in(line_starts, lo, cut)
+        if next_start is None:
+            next_start = _first_in(word_starts, lo, cut)
+        start = cut if next_start is None else next_start
+    return np.asarray(offsets, dtype=np.int64)
+
+
 def sliding_window_chunks(encoding, aligned_labels, token_bboxes, max_len=MAX_LEN, stride=STRIDE):
     """
     Split encoding into chunks of max_len with stride coverage.
     encoding has input_ids list.
     Return list of dicts with input_ids, attention_mask, labels, bboxes, word_ids slice-aware.
+    Slices are copies for lists and views for NumPy arrays.
     """
+    offsets = sliding_window_offsets(len(encoding["input_ids"]), max_len, stride)
+    return chunks_at(encoding, aligned_labels, token_bboxes, offsets)
+
+
+def line_window_chunks(encoding, aligned_labels, token_bboxes, line_ids=None, max_len=MAX_LEN, overlap=OVERLAP):
+    """
+    `sliding_window_chunks` with windows cut at word / line boundaries
+    (see `line_window_offsets`); `encoding` also needs "word_ids".
+    """
+    offsets = line_window_offsets(encoding["word_ids"], line_ids, max_len, overlap)
+    return chunks_at(encoding, aligned_labels, token_bboxes, offsets)
+
+
+def chunks_at(encoding, aligned_labels, token_bboxes, offsets) -> List[Dict]:
+    """Chunk dicts (input_ids, attention_mask, labels, bboxes, start, end) for (start, end) token offsets."""
     input_ids = encoding["input_ids"]
     attention_mask = encoding["attention_mask"]
-    n = len(input_ids)
     chunks = []
-    start = 0
-    while start < n:
-        end = min(start + max_len, n)
-        chunk_input_ids = input_ids[start:end]
-        chunk_attention = attention_mask[start:end]
-        chunk_labels = aligned_labels[start:end]
-        chunk_bboxes = token_bboxes[start:end]
-        chunks.append({
-            "input_ids": chunk_input_ids,
-            "attention_mask": chunk_attention,
-            "labels": chunk_labels,
-            "bboxes": chunk_bboxes,
+    with stage("chunk"):
+        for start, end in np.asarray(offsets).tolist():
+            chunks.append({
+                "input_ids": input_ids[start:end],
+                "attention_mask": attention_mask[start:end],
+                "labels": aligned_labels[start:end],
+                "bboxes": token_bboxes[start:end],
+                "start": start,
+                "end": end
+            })
+    count("chunks", len(chunks))
+    return chunks
+
+
+@dataclass
+class PageChunks:
+    """
+    One page's token arrays stored once, with chunks kept as (start, end)
+    offsets into them. Indexing returns NumPy views; nothing is copied until
+    `collate` (or serialization) materializes the windows.
+
+    With `reinsert_special=True` the page-level CLS/SEP are stripped, windows
+    cover max_len - 2 body tokens and `collate` wraps each one in CLS ... SEP,
+    as usual for LayoutLM training.
+    """
+    input_ids: np.ndarray       # (T,)
+    attention_mask: np.ndarray  # (T,)
+    labels: np.ndarray          # (T,)
+    bboxes: np.ndarray          # (T, 4)
+    offsets: np.ndarray         # (K, 2)
+    max_len: int = MAX_LEN
+    reinsert_special: bool = False
+
+    @classmethod
+    def from_tokenized(cls, tok: Dict, max_len=MAX_LEN, stride=STRIDE, reinsert_special=False) -> "PageChunks":
+        """`tok` is one page dict from `tokenize_and_align_batch`."""
+        body = slice(1, -1) if reinsert_special else slice(None)
+        arrays = {key: np.asarray(tok[key])[body] for key in ("input_ids", "attention_mask", "labels", "bboxes")}
+        window = max_len - 2 if reinsert_special else max_len
+        offsets = sliding_window_offsets(len(arrays["input_ids"]), window, min(stride, window))
+        return cls(offsets=offsets, max_len=max_len, reinsert_special=reinsert_special, **arrays)
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def __getitem__(self, i: int) -> Dict:
+        start, end = self.offsets[i].tolist()
+        return {
+            "input_ids": self.input_ids[start:end],
+            "attention_mask": self.attention_mask[start:end],
+            "labels": self.labels[start:end],
+            "bboxes": self.bboxes[start:end],
             "start": start,
             "end": end
-        })
-        if end == n:
-            break
-        start += stride
-    return chunks
\ No newline at end of file
+        }
+
+    def collate(self, cls_id=None, sep_id=None, pad_id=None) -> Dict[str, np.ndarray]:
+        """
+        All chunks as padded (K, max_len) arrays (bbox: (K, max_len, 4)), built
+        with one gather per field. Padding gets label -100 and a zero box.
+        Token ids default to the LayoutLMv3 tokenizer's special tokens (the
+        processor is only loaded when one of them is not given).
+        """
+        if cls_id is None or sep_id is None or pad_id is None:
+            tokenizer = get_processor().tokenizer
+            cls_id = tokenizer.cls_token_id if cls_id is None else cls_id
+            sep_id = tokenizer.sep_token_id if sep_id is None else sep_id
+            pad_id = tokenizer.pad_token_id if pad_id is None else pad_id
+
+        k = len(self.offsets)
+        starts, ends = self.offsets[:, 0], self.offsets[:, 1]
+        lengths = ends - starts
+        window = self.max_len - 2 if self.reinsert_special else self.max_len
+
+        idx = starts[:, None] + np.arange(window)
+        valid = idx < ends[:, None]
+        idx = np.where(valid, idx, 0)
+
+        first = 1 if self.reinsert_special else 0
+        cols = slice(first, first + window)
+        out = {
+            "input_ids": np.full((k, self.max_len), pad_id, dtype=np.int64),
+            "attention_mask": np.zeros((k, self.max_len), dtype=np.int64),
+            "labels": np.full((k, self.max_len), -100, dtype=np.int64),
+            "bbox": np.zeros((k, self.max_len, 4), dtype=np.int64),
+        }
+        if len(self.input_ids):
+            out["input_ids"][:, cols] = np.where(valid, self.input_ids[idx], pad_id)
+            out["attention_mask"][:, cols] = np.where(valid, self.attention_mask[idx], 0)
+            out["labels"][:, cols] = np.where(valid, self.labels[idx], -100)
+            out["bbox"][:, cols] = np.where(valid[..., None], self.bboxes[idx], 0)
+
+        if self.reinsert_special:
+            rows = np.arange(k)
+            out["input_ids"][:, 0] = cls_id
+            out["input_ids"][rows, lengths + 1] = sep_id
+            out["attention_mask"][:, 0] = 1
+            out["attention_mask"][rows, lengths + 1] = 1
+        return out
+
+
+# ------------- sequence packing -------------
+def pack_entries(entries: List[Dict], max_len=MAX_LEN, cls_id=None, sep_id=None) -> List[Dict]:
+    """
+    Pack consecutive chunk entries (e.g. a document's short pages) into
+    sequences of at most max_len tokens, `<s> A </s> B </s> ...`: each
+    segment's own CLS / SEP are dropped and one SEP separates the segments.
+    Packed entries carry "segments", one {"id", "image_path", "page", "start",
+    "end"} per segment with its token range in the sequence; their
+    "image_path" / "page" are the first segment's. Entries that do not share a
+    sequence with a neighbour are returned unchanged. Order is kept.
+    """
+    if cls_id is None or sep_id is None:
+        tokenizer = get_processor().tokenizer
+        cls_id = tokenizer.cls_token_id if cls_id is None else cls_id
+        sep_id = tokenizer.sep_token_id if sep_id is None else sep_id
+
+    def body(entry):
+        ids = entry["input_ids"]
+        first = 1 if len(ids) and ids[0] == cls_id else 0
+        last = len(ids) - 1 if len(ids) > first and ids[-1] == sep_id else len(ids)
+        return first, last
+
+    packed, group, used = [], [], 1
+    pack_ids = itertools.count()
+
+    def flush():
+        if len(group) == 1:
+            packed.append(group[0][0])
+        elif group:
+            packed.append(_packed_entry(group, next(pack_ids), cls_id, sep_id))
+        group.clear()
+
+    with stage("pack", chunks=len(entries)):
+        for entry in entries:
+            first, last = body(entry)
+            size = last - first + 1  # body + its separator
+            if used + size > max_len:
+                flush()
+                used = 1
+            group.append((entry, first, last))
+            used += size
+        flush()
+    return packed
+
+
+def _packed_entry(group, index: int, cls_id: int, sep_id: int) -> Dict:
+    head = group[0][0]
+    out = {"input_ids": [cls_id], "attention_mask": [1], "labels": [-100], "bboxes": [[0, 0, 0, 0]],
+           "words": ["[SPECIAL]"]}
+    segments = []
+    for entry, first, last in group:
+        start = len(out["input_ids"])
+        for key in ("input_ids", "attention_mask", "labels", "bboxes", "words"):
+            out[key].extend(entry[key][first:last])
+        segments.append({"id": entry["id"], "image_path": entry["image_path"], "page": entry["page"],
+                         "start": start, "end": len(out["input_ids"])})
+        out["input_ids"].append(sep_id)
+        out["attention_mask"].append(1)
+        out["labels"].append(-100)
+        out["bboxes"].append([0, 0, 0, 0])
+        out["words"].append("[SPECIAL]")
+    prefix = str(head["id"]).rsplit("_page", 1)[0]
+    return {"id": f"{prefix}_page{head['page']}_pack{index}", "image_path": head["image_path"],
+            "page": head["page"], **out, "segments": segments}
+
+
+def sequence_stats(entries: List[Dict], max_len=MAX_LEN) -> Dict:
+    """Sequences, real tokens and packing efficiency (real tokens / padded max_len slots) of chunk entries."""
+    tokens = sum(len(entry["input_ids"]) for entry in entries)
+    return {"sequences": len(entries), "tokens": tokens,
+            "efficiency": tokens / (len(entries) * max_len) if entries else 0.0}
@@ -0,0 +1,54 @@
+import numpy as np
+
+from src.parsing.geometry import pixels_to_layoutlm, relative_to_layoutlm, relative_to_pixels, layoutlm_to_pixels
+
+SIZES = [(1700, 2200), (1654, 2339), (613, 791)]
+
+
+def _loop_normalize(bbox, size):
+    """The original per-box normalize_bboxes arithmetic."""
+    w, h = size
+    x0, y0, x1, y1 = bbox
+    nx0, ny0 = int((x0 / w) * 1000), int((y0 / h) * 1000)
+    nx1, ny1 = int((x1 / w) * 1000), int((y1 / h) * 1000)
+    return [max(0, nx0), max(0, ny0), min(1000, nx1), min(1000, ny1)]
+
+
+def _loop_relative(geom, size):
+    """The original per-word docTR geometry -> pixel casts."""
+    w, h = size
+    (x0, y0), (x1, y1) = geom
+    return [int(x0 * w), int(y0 * h), int(x1 * w), int(y1 * h)]
+
+
+def _random_geoms(rng, n=500):
+    xy0 = rng.random((n, 2)) * 0.9
+    return np.concatenate([xy0, xy0 + rng.random((n, 2)) * 0.1], axis=1)
+
+
+def test_relative_to_layoutlm_matches_loop():
+    rng = np.random.default_rng(0)
+    for size in SIZES:
+        geoms = _random_geoms(rng)
+        pixels, norm = relative_to_layoutlm(geoms, size)
+        expected_px = [_loop_relative(((g[0], g[1]), (g[2], g[3])), size) for g in geoms.tolist()]
+        assert pixels.tolist() == expected_px
+        assert norm.tolist() == [_loop_normalize(b, size) for b in expected_px]
+        assert relative_to_pixels(geoms, size).tolist() == expected_px
+
+
+def test_pixels_to_layoutlm_clips_like_loop():
+    size = (1000, 500)
+    boxes = [[-5, -1, 1200, 600], [0, 0, 1000, 500], [999, 499, 1000, 500], [3, 7, 3, 7]]
+    assert pixels_to_layoutlm(boxes, size).tolist() == [_loop_normalize(b, size) for b in boxes]
+    assert pixels_to_layoutlm([], size).shape == (0, 4)
+
+
+def test_layoutlm_to_pixels_matches_denormalize_loop():
+    rng = np.random.default_rng(1)
+    norm = rng.integers(0, 1001, size=(200, 4))
+    for w, h in SIZES:
+        # the original denormalize_bbox arithmetic
+        expected = [[int((x0 / 1000) * w), int((y0 / 1000) * h), int((x1 / 1000) * w), int((y1 / 1000) * h)]
+                    for x0, y0, x1, y1 in norm.tolist()]
+        assert layoutlm_to_pixels(norm, (w, h)).tolist() == expected
@@ -0,0 +1,40 @@
+import numpy as np
+
+from src.parsing.page_tokens import PageTokens
+
+
+def _page():
+    # two lines: a header line of two words, then a line of two words inside table 0
+    return PageTokens(
+        words=["Annual", "Report", "Revenue", "42"],
+        bboxes=np.asarray([[10, 10, 60, 30], [65, 10, 120, 30], [10, 50, 70, 62], [80, 50, 95, 62]], dtype=np.int32),
+        line_ids=np.asarray([0, 0, 1, 1], dtype=np.int32),
+        lines=["Annual Report", "Revenue 42"],
+        line_bboxes=np.asarray([[10, 10, 120, 30], [10, 50, 95, 62]], dtype=np.int32),
+        line_header=np.asarray([True, False]),
+        table_ids=np.asarray([-1, -1, 0, 0], dtype=np.int32),
+        image_size=(200, 100),
+    )
+
+
+def test_per_word_views_follow_line_ids():
+    page = _page()
+    assert len(page) == 4
+    assert page.header.tolist() == [True, True, False, False]
+    assert page.inside_table.tolist() == [False, False, True, True]
+
+
+def test_to_dicts_expands_line_fields_per_word():
+    tokens = _page().to_dicts()
+    assert [t["word"] for t in tokens] == ["Annual", "Report", "Revenue", "42"]
+    assert tokens[1] == {
+        "word": "Report", "bbox": [65, 10, 120, 30], "height": 20, "line_text": "Annual Report",
+        "line_bbox": [10, 10, 120, 30], "header": True, "inside_table": False, "table_id": -1,
+    }
+    assert tokens[3]["inside_table"] and tokens[3]["table_id"] == 0 and tokens[3]["height"] == 12
+
+
+def test_empty_page():
+    page = PageTokens.empty((200, 100))
+    assert len(page) == 0 and page.to_dicts() == []
+    assert page.bboxes.shape == (0, 4) and page.header.shape == (0,)
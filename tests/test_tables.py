@@ -0,0 +1,43 @@
+import numpy as np
+
+from src.parsing.tables import assign_tables
+
+
+def _loop_in_table(bbox, table_bboxes):
+    """The original nested in_table helper of ocr_doctr."""
+    x0, y0, x1, y1 = bbox
+    for tx0, ty0, tx1, ty1 in table_bboxes:
+        if x0 >= tx0 and y0 >= ty0 and x1 <= tx1 and y1 <= ty1:
+            return True
+    return False
+
+
+def _loop_table_id(bbox, table_bboxes):
+    x0, y0, x1, y1 = bbox
+    for i, (tx0, ty0, tx1, ty1) in enumerate(table_bboxes):
+        if x0 >= tx0 and y0 >= ty0 and x1 <= tx1 and y1 <= ty1:
+            return i
+    return -1
+
+
+def _random_boxes(rng, n, size=2000, max_side=400):
+    xy0 = rng.integers(0, size - max_side, size=(n, 2))
+    return np.concatenate([xy0, xy0 + rng.integers(1, max_side, size=(n, 2))], axis=1)
+
+
+def test_assign_tables_matches_loop():
+    rng = np.random.default_rng(0)
+    words = _random_boxes(rng, 3000, max_side=60)
+    tables = _random_boxes(rng, 40)  # overlapping tables: the first one wins
+    # small block size so the blocked broadcast is exercised too
+    table_ids = assign_tables(words, tables, block_size=256)
+    assert table_ids.tolist() == [_loop_table_id(w, tables.tolist()) for w in words.tolist()]
+    assert (table_ids >= 0).tolist() == [_loop_in_table(w, tables.tolist()) for w in words.tolist()]
+
+
+def test_assign_tables_edges_and_empty_inputs():
+    tables = [[100, 100, 200, 200]]
+    words = [[100, 100, 200, 200], [99, 100, 150, 150], [150, 150, 201, 160]]
+    assert assign_tables(words, tables).tolist() == [0, -1, -1]
+    assert assign_tables(words, []).tolist() == [-1, -1, -1]
+    assert assign_tables([], tables).tolist() == []
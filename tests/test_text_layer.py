@@ -0,0 +1,81 @@
+import os
+
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+
+from src.parsing.text_layer import has_text_layer, read_text_layer
+
+# a US-letter page in PDF points, rendered at 72 dpi so points == pixels
+WIDTH, HEIGHT = 612, 792
+
+
+def _page(lines):
+    """Text-layer page (see parse_bbox_layout) with one block of `lines` of (word, box)."""
+    return {"width": float(WIDTH), "height": float(HEIGHT), "blocks": [lines]}
+
+
+def _render(boxes):
+    """White page with a black bar drawn for each box, standing in for glyphs."""
+    img = Image.new("RGB", (WIDTH, HEIGHT), "white")
+    draw = ImageDraw.Draw(img)
+    for x0, y0, x1, y1 in boxes:
+        draw.rectangle((x0 + 1, y0 + 2, x1 - 1, y1 - 2), fill="black")
+    return np.asarray(img)
+
+
+def _body_lines(n_lines=30, words_per_line=8):
+    lines = []
+    for row in range(n_lines):
+        y = 72 + row * 20
+        lines.append([(f"w{row}_{col}", (72.0 + col * 58, float(y), 72.0 + col * 58 + 50, float(y + 12)))
+                      for col in range(words_per_line)])
+    return lines
+
+
+def _boxes(lines):
+    return [box for line in lines for _, box in line]
+
+
+def test_born_digital_page_uses_text_layer():
+    lines = _body_lines()
+    assert has_text_layer(_page(lines), _render(_boxes(lines)))
+
+
+def test_scan_with_small_text_overlay_is_ocrd():
+    # the scanned body is only ink; the text layer holds just a stamped Bates number
+    body = _boxes(_body_lines())
+    bates = [[(word, (400.0 + i * 30, 760.0, 400.0 + i * 30 + 26, 770.0))
+              for i, word in enumerate(["ABC", "000123", "Confidential", "Page", "1"])]]
+    page = _page(bates)
+    rgb = _render(body + _boxes(bates))
+    assert not has_text_layer(page, rgb)
+    # without the rendered page the tiny word area gives it away as well
+    assert not has_text_layer(page)
+
+
+def test_too_few_words_or_unmapped_fonts_need_ocr():
+    lines = _body_lines()
+    assert not has_text_layer(_page([lines[0][:3]]))
+    broken = [[("��", box) for _, box in line] for line in lines]
+    assert not has_text_layer(_page(broken), _render(_boxes(lines)))
+
+
+def _fake_pdftotext(tmp_path, script):
+    exe = tmp_path / "pdftotext"
+    exe.write_text("#!/bin/sh\n" + script)
+    exe.chmod(0o755)
+    return str(tmp_path)
+
+
+def test_unreadable_text_layer_falls_back_to_ocr(tmp_path):
+    # no pdftotext at all
+    assert read_text_layer(tmp_path / "doc.pdf", 1, 2, poppler_path=str(tmp_path / "missing")) == {}
+
+
+@pytest.mark.skipif(os.name == "nt", reason="fake pdftotext is a shell script")
+def test_damaged_pdf_or_malformed_output_falls_back_to_ocr(tmp_path):
+    failing = _fake_pdftotext(tmp_path, "echo 'Syntax Error' >&2\nexit 1\n")
+    assert read_text_layer(tmp_path / "doc.pdf", 1, 2, poppler_path=failing) == {}
+    malformed = _fake_pdftotext(tmp_path, "echo '<html><body><page'\n")
+    assert read_text_layer(tmp_path / "doc.pdf", 1, 2, poppler_path=malformed) == {}
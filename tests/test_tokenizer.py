@@ -0,0 +1,166 @@
+import numpy as np
+import pytest
+
+from src.tokenizer.tokenizer import (align_to_tokens, line_window_offsets, pack_entries, sequence_stats,
+                                     sliding_window_offsets)
+
+
+def _loop_windows(n, max_len, stride):
+    """The original while-loop of sliding_window_chunks."""
+    windows, start = [], 0
+    while start < n:
+        end = min(start + max_len, n)
+        windows.append((start, end))
+        if end == n:
+            break
+        start += stride
+    return windows
+
+
+@pytest.mark.parametrize("max_len, stride", [(512, 384), (10, 3), (10, 10), (7, 1)])
+def test_sliding_window_offsets_match_loop(max_len, stride):
+    for n in [0, 1, max_len - 1, max_len, max_len + 1, 3 * max_len + 5, 1000]:
+        assert sliding_window_offsets(n, max_len, stride).tolist() == [list(w) for w in _loop_windows(n, max_len, stride)]
+
+
+@pytest.mark.parametrize("stride", [0, -1, 11, 12])
+def test_sliding_window_offsets_reject_invalid_stride(stride):
+    with pytest.raises(ValueError):
+        sliding_window_offsets(11, max_len=10, stride=stride)
+
+
+def _loop_align(word_ids, word_labels, bboxes, words):
+    """The original per-token loops of tokenize_and_align_labels and process_image."""
+    labels, token_bboxes, token_words = [], [], []
+    for idx in word_ids:
+        if idx is None:
+            labels.append(-100)
+            token_bboxes.append([0, 0, 0, 0])
+            token_words.append("[SPECIAL]")
+        else:
+            labels.append(word_labels[idx])
+            token_bboxes.append(bboxes[idx])
+            token_words.append(words[idx])
+    return labels, token_bboxes, token_words
+
+
+def test_align_to_tokens_matches_loop():
+    rng = np.random.default_rng(0)
+    words = [f"w{i}" for i in range(50)]
+    word_labels = rng.integers(0, 5, size=50).tolist()
+    bboxes = rng.integers(0, 1001, size=(50, 4)).tolist()
+    # CLS, each word split into 1-3 subword tokens, SEP
+    word_ids = [None] + [i for i in range(50) for _ in range(int(rng.integers(1, 4)))] + [None]
+    labels, token_bboxes, token_words = align_to_tokens(word_ids, word_labels, bboxes, words=words)
+    expected = _loop_align(word_ids, word_labels, bboxes, words)
+    assert (labels.tolist(), token_bboxes.tolist(), token_words) == expected
+
+
+def test_align_to_tokens_page_without_words():
+    labels, token_bboxes, token_words = align_to_tokens([None, None], [], [], words=[])
+    assert labels.tolist() == [-100, -100]
+    assert token_bboxes.tolist() == [[0, 0, 0, 0]] * 2
+    assert token_words == ["[SPECIAL]"] * 2
+
+
+def _page_tokens(words_per_line, n_lines, rng):
+    """word_ids (CLS / SEP as None, 1-3 tokens per word) and each word's line."""
+    n_words = words_per_line * n_lines
+    word_ids = [None] + [i for i in range(n_words) for _ in range(int(rng.integers(1, 4)))] + [None]
+    line_ids = [i // words_per_line for i in range(n_words)]
+    return word_ids, line_ids
+
+
+def _starts(word_ids, line_ids):
+    """Token positions where a word / a line starts (special tokens start both)."""
+    words, lines = set(), set()
+    for t, idx in enumerate(word_ids):
+        prev = word_ids[t - 1] if t else "start"
+        if idx is None or idx != prev:
+            words.add(t)
+            if idx is None or prev is None or prev == "start" or line_ids[idx] != line_ids[prev]:
+                lines.add(t)
+    return words, lines
+
+
+def _check_windows(offsets, n, max_len, overlap):
+    offsets = offsets.tolist()
+    assert offsets[0][0] == 0 and offsets[-1][1] == n
+    for (start, end), (next_start, _) in zip(offsets, offsets[1:]):
+        assert start < next_start <= end            # progress, no gap
+        assert end - next_start <= overlap          # overlap stays within budget
+    assert all(0 < end - start <= max_len for start, end in offsets)
+
+
+def test_line_windows_cut_at_lines_on_long_page():
+    rng = np.random.default_rng(0)
+    word_ids, line_ids = _page_tokens(words_per_line=8, n_lines=60, rng=rng)
+    n, max_len, overlap = len(word_ids), 64, 24
+    offsets = line_window_offsets(word_ids, line_ids, max_len=max_len, overlap=overlap)
+    _check_windows(offsets, n, max_len, overlap)
+    assert len(offsets) > 1
+    words, lines = _starts(word_ids, line_ids)
+    for start, end in offsets.tolist()[:-1]:
+        assert end in lines and end - start > max_len // 2
+    for (_, prev_end), (start, _) in zip(offsets.tolist(), offsets.tolist()[1:]):
+        # overlap: the first whole line within `overlap` tokens before the cut, else the first whole word
+        window = range(prev_end - overlap, prev_end)
+        in_lines = [t for t in window if t in lines]
+        assert start == (in_lines[0] if in_lines else min(t for t in window if t in words))
+
+
+def test_line_longer_than_window_cuts_at_words():
+    rng = np.random.default_rng(1)
+    word_ids, line_ids = _page_tokens(words_per_line=200, n_lines=1, rng=rng)
+    n, max_len, overlap = len(word_ids), 32, 8
+    offsets = line_window_offsets(word_ids, line_ids, max_len=max_len, overlap=overlap)
+    _check_windows(offsets, n, max_len, overlap)
+    words, _ = _starts(word_ids, line_ids)
+    assert all(end in words for _, end in offsets.tolist()[:-1])
+
+
+def test_word_longer_than_window_is_split():
+    word_ids = [None] + [0] * 25 + [1, 1, None]
+    offsets = line_window_offsets(word_ids, [0, 0], max_len=10, overlap=4)
+    _check_windows(offsets, len(word_ids), 10, 4)
+    assert offsets.tolist()[0] == [0, 10]
+
+
+CLS, SEP = 0, 2
+
+
+def _entry(page, body_len, doc="7"):
+    ids = [CLS] + list(range(100 + page * 1000, 100 + page * 1000 + body_len)) + [SEP]
+    return {"id": f"{doc}_page{page}_chunk0", "image_path": f"p{page}.png", "page": page, "input_ids": ids,
+            "attention_mask": [1] * len(ids), "labels": [-100] + [page] * body_len + [-100],
+            "bboxes": [[0, 0, 0, 0]] + [[page, 0, 0, 0]] * body_len + [[0, 0, 0, 0]],
+            "words": ["[SPECIAL]"] + [f"w{page}"] * body_len + ["[SPECIAL]"]}
+
+
+def test_pack_entries_across_pages():
+    entries = [_entry(0, 5), _entry(1, 3), _entry(2, 30), _entry(3, 4)]
+    packed = pack_entries(entries, max_len=16, cls_id=CLS, sep_id=SEP)
+
+    # pages 0 and 1 share a sequence (1 + 6 + 4 = 11 <= 16); page 2 alone does not fit
+    # and is returned unchanged, page 3 starts a new (single, unchanged) group
+    assert [p.get("segments") is not None for p in packed] == [True, False, False]
+    first = packed[0]
+    assert first["id"] == "7_page0_pack0" and first["page"] == 0 and first["image_path"] == "p0.png"
+    ids = first["input_ids"]
+    assert ids[0] == CLS and ids[-1] == SEP and ids.count(CLS) == 1 and ids.count(SEP) == 2
+    for key in ("attention_mask", "labels", "bboxes", "words"):
+        assert len(first[key]) == len(ids)
+    for seg, entry in zip(first["segments"], entries[:2]):
+        assert ids[seg["start"]:seg["end"]] == entry["input_ids"][1:-1]
+        assert first["labels"][seg["start"]:seg["end"]] == entry["labels"][1:-1]
+        assert ids[seg["end"]] == SEP
+        assert (seg["id"], seg["page"], seg["image_path"]) == (entry["id"], entry["page"], entry["image_path"])
+    assert packed[1] is entries[2] and packed[2] is entries[3]
+
+
+def test_sequence_stats_efficiency():
+    entries = [_entry(0, 5), _entry(1, 3)]
+    packed = pack_entries(entries, max_len=16, cls_id=CLS, sep_id=SEP)
+    assert sequence_stats(entries, max_len=16) == {"sequences": 2, "tokens": 12, "efficiency": 12 / 32}
+    assert sequence_stats(packed, max_len=16) == {"sequences": 1, "tokens": 11, "efficiency": 11 / 16}
+    assert sequence_stats([], max_len=16)["efficiency"] == 0.0